@@ -4,29 +4,54 @@
 import eventlet
 eventlet.monkey_patch()
 
-import json
+import atexit
+import bisect
+import difflib
+import hashlib
+import logging
 import os
+import re
 import shutil
+import stat
+import subprocess
+import threading
 import time
+import uuid
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from enum import IntEnum
+from functools import lru_cache
+from pathlib import Path
 
-import google.generativeai as genai
-from anthropic import Anthropic
+import orjson
 from dotenv import load_dotenv
+from eventlet import tpool
 from flask import Flask, jsonify, render_template, request, send_from_directory
-from flask_socketio import SocketIO
-from openai import OpenAI
+from flask_socketio import SocketIO, join_room, leave_room, rooms
 
+from json_provider import OrjsonProvider
+from prompt_cache import PromptCache
 from terminal_manager import TerminalManager
 from workspace_manager import WorkspaceManager
 
+# Use the C implementation of SequenceMatcher when it is installed.
+# unified_diff looks the class up on the difflib module, so every diff picks
+# it up; the opcodes, and therefore the diff text, are identical.
+try:
+    from cdifflib import CSequenceMatcher
+    difflib.SequenceMatcher = CSequenceMatcher
+except ImportError:
+    pass
+
 
 # Model configurations
 AVAILABLE_MODELS = {
     "deepseek-r1": {
         "name": "DeepSeek R1",
         "api_key_env": "DEEPSEEK_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "base_url": "https://api.deepseek.com",
         "models": {
             "code": "deepseek-reasoner",
@@ -37,7 +62,7 @@ AVAILABLE_MODELS = {
     "deepseek": {
         "name": "DeepSeek V3",
         "api_key_env": "DEEPSEEK_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "base_url": "https://api.deepseek.com",
         "models": {
             "code": "deepseek-chat",
@@ -48,7 +73,7 @@ AVAILABLE_MODELS = {
     "deepseek-openrouter": {
         "name": "DeepSeek V3 (OpenRouter)",
         "api_key_env": "OPENROUTER_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "base_url": "https://openrouter.ai/api/v1",
         "models": {
             "code": "deepseek/deepseek-chat",
@@ -59,7 +84,7 @@ AVAILABLE_MODELS = {
     "codestral": {
         "name": "Codestral",
         "api_key_env": "CODESTRAL_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "base_url": "https://codestral.mistral.ai/v1",
         "models": {
             "code": "codestral-latest",
@@ -80,7 +105,7 @@ AVAILABLE_MODELS = {
     "grok": {
         "name": "Grok 2",
         "api_key_env": "GROK_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "base_url": "https://api.x.ai/v1",
         "models": {
             "code": "grok-2-latest",
@@ -91,7 +116,7 @@ AVAILABLE_MODELS = {
     "claude": {
         "name": "Claude 3.5 Sonnet",
         "api_key_env": "ANTHROPIC_API_KEY",
-        "client_class": Anthropic,
+        "client_class": "anthropic",
         "models": {
             "code": "claude-3-5-sonnet-20241022",
             "chat": "claude-3-5-sonnet-20241022",
@@ -101,7 +126,7 @@ AVAILABLE_MODELS = {
     "gpt-4-turbo": {
         "name": "GPT-4 Turbo",
         "api_key_env": "OPENAI_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "models": {
             "code": "gpt-4-turbo",
             "chat": "gpt-4-turbo"
@@ -111,7 +136,7 @@ AVAILABLE_MODELS = {
     "gpt-4o-mini": {
         "name": "GPT-4o-mini",
         "api_key_env": "OPENAI_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "models": {
             "code": "gpt-4o-mini",
             "chat": "gpt-4o-mini"
@@ -121,7 +146,7 @@ AVAILABLE_MODELS = {
     "gpt-4o": {
         "name": "GPT-4o",
         "api_key_env": "OPENAI_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "models": {
             "code": "gpt-4o",
             "chat": "gpt-4o"
@@ -131,22 +156,24 @@ AVAILABLE_MODELS = {
     "o1-mini": {
         "name": "o1-mini",
         "api_key_env": "OPENAI_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "models": {
             "code": "o1-mini",
             "chat": "o1-mini"
         },
         "max_tokens": 100000,
+        "system_in_user": True,
     },
     "o1": {
         "name": "o1-preview",
         "api_key_env": "OPENAI_API_KEY",
-        "client_class": OpenAI,
+        "client_class": "openai",
         "models": {
             "code": "o1-preview",
             "chat": "o1-preview"
         },
         "max_tokens": 100000,
+        "system_in_user": True,
     },
 }
 
@@ -217,37 +244,252 @@ IMPORTANT:
 
 Respond with a single, valid JSON object."""
 
+# System prompt as an Anthropic content block, marked as a cacheable prefix so
+# the provider can reuse it across requests instead of re-processing it
+SYSTEM_PROMPT_BLOCK = {
+    "type": "text",
+    "text": system_prompt,
+    "cache_control": {
+        "type": "ephemeral"
+    },
+}
+
 # Initialize clients for each model
 load_dotenv()
 
-model_clients = {}
+
+class ModelKind(IntEnum):
+    """Client API used to talk to a model"""
+    OPENAI = 1
+    ANTHROPIC = 2
+    GENAI = 3
+
+
+MODEL_KINDS = {
+    "openai": ModelKind.OPENAI,
+    "anthropic": ModelKind.ANTHROPIC,
+    "genai": ModelKind.GENAI,
+}
+
+# Resolved model settings; system_in_user marks models that reject system
+# messages and only accept the default temperature. client stays None until
+# the model is first used.
+ModelConfig = namedtuple(
+    "ModelConfig", "name client kind code_model chat_model max_tokens "
+    "system_in_user api_key base_url")
+
+# Registry of configured models, built once at import
+MODEL_REGISTRY = {}
 for model_id, config in AVAILABLE_MODELS.items():
+    kind = MODEL_KINDS.get(config["client_class"])
+    if kind is None:
+        raise ValueError(
+            f"Unknown client class for model {model_id}: {config['client_class']}")
     api_key = os.getenv(config["api_key_env"])
     if api_key:
-        if config["client_class"] == "genai":
-            genai.configure(api_key=api_key)
-            model_clients[model_id] = genai
-        else:
-            client_kwargs = {"api_key": api_key}
-            # Add base_url if specified
-            if "base_url" in config:
-                client_kwargs["base_url"] = config["base_url"]
+        MODEL_REGISTRY[model_id] = ModelConfig(
+            name=config["name"],
+            client=None,
+            kind=kind,
+            code_model=config["models"]["code"],
+            chat_model=config["models"]["chat"],
+            max_tokens=config.get("max_tokens", 100000),
+            system_in_user=config.get("system_in_user", False),
+            api_key=api_key,
+            base_url=config.get("base_url"),
+        )
+
+_model_client_lock = threading.Lock()
+
+# Connection pool for each provider endpoint. Idle connections are kept
+# longer than httpx's 5 s default so a user's next request skips the TCP
+# and TLS handshake
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 50
+HTTP_KEEPALIVE_EXPIRY = 30
+
+
+@lru_cache(maxsize=None)
+def _resolve_client_class(kind):
+    """Import a provider SDK the first time one of its models is used"""
+    if kind is ModelKind.ANTHROPIC:
+        from anthropic import Anthropic
+        return Anthropic
+    if kind is ModelKind.GENAI:
+        import google.generativeai as genai
+        return genai
+    from openai import OpenAI
+    return OpenAI
+
+
+@lru_cache(maxsize=None)
+def _api_client(kind, api_key, base_url):
+    """Create one SDK client per endpoint, shared by the models on it"""
+    import httpx
+    if kind is ModelKind.ANTHROPIC:
+        from anthropic import DefaultHttpxClient
+    else:
+        from openai import DefaultHttpxClient
+
+    client_kwargs = {
+        "api_key":
+        api_key,
+        "http_client":
+        DefaultHttpxClient(limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )),
+    }
+    # Add base_url if specified
+    if base_url:
+        client_kwargs["base_url"] = base_url
+
+    client = _resolve_client_class(kind)(**client_kwargs)
+    atexit.register(client.close)
+    return client
+
+
+def get_model_config(model_id):
+    """Return a configured model, creating its client on first use"""
+    model_config = MODEL_REGISTRY.get(model_id)
+    if model_config is None or model_config.client is not None:
+        return model_config
+
+    with _model_client_lock:
+        model_config = MODEL_REGISTRY[model_id]
+        if model_config.client is None:
+            if model_config.kind is ModelKind.GENAI:
+                client = _resolve_client_class(model_config.kind)
+                client.configure(api_key=model_config.api_key)
+            else:
+                client = _api_client(model_config.kind, model_config.api_key,
+                                     model_config.base_url)
+            model_config = model_config._replace(client=client)
+            MODEL_REGISTRY[model_id] = model_config
+    return model_config
+
+
+def code_suggestion_temperature(model_config):
+    """Sampling temperature used for a model's code suggestions"""
+    # Models that only take the default temperature sample at 1
+    return 1 if model_config.system_in_user else CODE_SUGGESTION_TEMPERATURE
 
-            model_clients[model_id] = config["client_class"](**client_kwargs)
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # For session management
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Encode responses and decode request bodies with orjson
+app.json = OrjsonProvider(app)
+# Message queue URL (e.g. redis://localhost:6379/0) shared by several
+# server processes, so events reach clients connected to any of them
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or None
+# Pin the eventlet async mode so Flask-SocketIO doesn't probe for others
+socketio = SocketIO(app,
+                    cors_allowed_origins="*",
+                    async_mode="eventlet",
+                    message_queue=SOCKETIO_MESSAGE_QUEUE)
+
+# Development mode (debugger, reloader and verbose logging), opt-in only
+DEBUG = os.environ.get("FLASK_DEBUG") == "1"
+
+# Verbose per-request output (paths, generated diffs, lint results, raw
+# model JSON) is logged at DEBUG level and only written in DEBUG mode
+logger = logging.getLogger("jarvis")
+logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+logger.addHandler(_log_handler)
 
 # Set up workspace directory
 WORKSPACE_ROOT = os.path.join(os.getcwd(), "workspaces")
 os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+# Normalized once here for the containment checks done per request
+WORKSPACE_ROOT_ABS = os.path.abspath(WORKSPACE_ROOT)
+
+# Deleted workspaces are moved here and removed in the background
+TRASH_DIR = os.path.join(WORKSPACE_ROOT, ".trash")
 
 # Initialize workspace manager
 workspace_manager = WorkspaceManager(WORKSPACE_ROOT)
 
-# Store terminal managers for each client
-terminal_managers = {}
+# Cache of AI suggestions for repeated prompts over unchanged files, kept
+# on disk as well so it survives restarts. It lives outside WORKSPACE_ROOT,
+# whose mtime the workspace index watches
+PROMPT_CACHE_DB = os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "jarvis",
+    "prompt_cache.sqlite3")
+prompt_cache = PromptCache(db_path=PROMPT_CACHE_DB)
+
+# Temperature for code suggestions. Only suggestions sampled at 0 are
+# cached, since a sampled answer isn't the one answer to a prompt; the
+# default of 0.1 leaves the prompt cache unused
+CODE_SUGGESTION_TEMPERATURE = float(
+    os.environ.get("CODE_SUGGESTION_TEMPERATURE", "0.1"))
+
+# Store terminal managers for each client. Entries are weak so a manager
+# whose shell exited is reclaimed even if the client never disconnects
+# cleanly; a running reader task keeps its manager alive.
+terminal_managers = weakref.WeakValueDictionary()
+
+# Skipped file extensions as a tuple, ready for str.endswith
+SKIP_EXTENSIONS = workspace_manager.SKIP_SUFFIXES
+
+# File counts for the workspace history, keyed by workspace ID and
+# invalidated when the workspace directory's mtime changes
+_history_cache = {}
+
+# Browser cache lifetime for the logo and favicon, in seconds
+ICON_MAX_AGE = 24 * 60 * 60
+
+# Native threads used to read workspace files for the model context
+FILE_READ_WORKERS = 16
+
+# Workspace IDs as sorted (lowercased ID, ID) pairs, and the WORKSPACE_ROOT
+# mtime they reflect; rebuilt from disk only when the root changes elsewhere
+_workspace_index = []
+_workspace_index_mtime = None
+
+# pylama results keyed by (path, mtime_ns, size, content digest); the oldest
+# entries are dropped once the cache is full
+_lint_cache = {}
+LINT_CACHE_MAX_ENTRIES = 512
+
+# Tokens kept free of context when a prompt has to be truncated
+PROMPT_TOKEN_RESERVE = 1000
+
+# Streaming progress events: seconds between updates, a wider interval
+# once a response gets long, and the fewest new characters worth reporting
+STATUS_UPDATE_INTERVAL = 0.5
+STATUS_UPDATE_INTERVAL_LARGE = 1.0
+STATUS_LARGE_RESPONSE_CHARS = 16 * 1024
+STATUS_MIN_NEW_CHARS = 512
+
+# Streamed text is sent to the client in batches: at most this many
+# seconds or chunks are held back before one combined event goes out
+CHUNK_EMIT_INTERVAL = 0.25
+CHUNK_EMIT_MAX_CHUNKS = 32
+
+# Seconds an /available-folders listing may be reused while the folder
+# itself is unchanged; nested size and file counts can lag this long
+FOLDER_LISTING_TTL = 30
+
+# Files counted per folder in /available-folders before giving up, so a
+# huge tree doesn't stall the listing
+FOLDER_STATS_MAX_FILES = 100000
+
+# Per-thread scratch buffers for reading small context files
+READ_BUFFER_SIZE = 64 * 1024
+_read_buffers = threading.local()
+
+# /chat folder contents keyed by folder path, as (digest of its files'
+# names, mtimes and sizes, contents, characters held). Least recently used
+# folders are dropped once the entries or their total characters exceed
+# these limits
+_context_cache = {}
+_context_cache_chars = 0
+CONTEXT_CACHE_MAX_ENTRIES = 256
+CONTEXT_CACHE_MAX_CHARS = 64 * 1024 * 1024
 
 
 @app.route("/")
@@ -260,33 +502,59 @@ def handle_connect():
     print(f"Client connected: {request.sid}")
 
 
+# Prefix of the Socket.IO rooms holding the clients that have a workspace open
+WORKSPACE_ROOM_PREFIX = "workspace:"
+
+
+def workspace_room(workspace_id):
+    """Return the room for clients that have workspace_id open"""
+    return f"{WORKSPACE_ROOM_PREFIX}{workspace_id}"
+
+
+@socketio.on("join_workspace")
+def handle_join_workspace(data):
+    # A client follows one workspace at a time
+    for room in rooms():
+        if room.startswith(WORKSPACE_ROOM_PREFIX):
+            leave_room(room)
+    workspace_id = (data or {}).get("workspace_id")
+    if workspace_id:
+        join_room(workspace_room(workspace_id))
+
+
 @socketio.on("disconnect")
 def handle_disconnect():
     # Cleanup terminal if it exists
-    if request.sid in terminal_managers:
-        terminal_managers[request.sid].cleanup()
-        del terminal_managers[request.sid]
+    manager = terminal_managers.pop(request.sid, None)
+    if manager is not None:
+        manager.cleanup()
     print(f"Client disconnected: {request.sid}")
 
 
 @socketio.on("terminal_init")
 def handle_terminal_init(data):
-    # Create new terminal manager for this client
-    terminal_managers[request.sid] = TerminalManager(socketio)
-    terminal_managers[request.sid].start(data["cols"], data["rows"])
+    # Create new terminal manager for this client, holding it locally until
+    # its reader task has started and keeps it alive
+    manager = TerminalManager(socketio)
+    manager.start(data["cols"], data["rows"])
+    previous = terminal_managers.get(request.sid)
+    terminal_managers[request.sid] = manager
+    if previous is not None:
+        previous.cleanup()
 
 
 @socketio.on("terminal_input")
 def handle_terminal_input(data):
-    if request.sid in terminal_managers:
-        terminal_managers[request.sid].write(data["data"])
+    manager = terminal_managers.get(request.sid)
+    if manager is not None:
+        manager.write(data["data"])
 
 
 @socketio.on("terminal_resize")
 def handle_terminal_resize(data):
-    if request.sid in terminal_managers:
-        terminal_managers[request.sid].resize_terminal(data["cols"],
-                                                       data["rows"])
+    manager = terminal_managers.get(request.sid)
+    if manager is not None:
+        manager.resize_terminal(data["cols"], data["rows"])
 
 
 def create_workspace():
@@ -294,54 +562,247 @@ def create_workspace():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     workspace_id = timestamp
     workspace_path = os.path.join(WORKSPACE_ROOT, workspace_id)
+    root_mtime = workspace_root_mtime()
     os.makedirs(workspace_path, exist_ok=True)
+    update_workspace_index(root_mtime, added=workspace_id)
     return workspace_id, workspace_path
 
 
+def iter_workspace_files(top, skip_dir=None):
+    """Recursively yield (DirEntry, rel_path) for every file below top.
+
+    Uses os.scandir so file types come from the directory read instead of
+    a stat per entry. Directories for which skip_dir(name) is true are not
+    descended into.
+    """
+    stack = [(top, "")]
+    while stack:
+        dir_path, rel_dir = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    rel_path = (f"{rel_dir}{os.sep}{entry.name}"
+                                if rel_dir else entry.name)
+                    if entry.is_dir():
+                        # Like os.walk, don't descend into symlinked
+                        # directories
+                        if not entry.is_symlink() and (
+                                skip_dir is None or not skip_dir(entry.name)):
+                            stack.append((entry.path, rel_path))
+                    else:
+                        yield entry, rel_path
+        except OSError as e:
+            print(f"Warning: Could not scan directory {dir_path}: {e}")
+
+
+def folder_stats(path):
+    """Return (total size, file count) below path, skipping hidden folders"""
+    total_size = 0
+    file_count = 0
+    # One scandir walk serves both totals; DirEntry.stat() reuses the
+    # data from the directory read where the platform provides it
+    for entry, _ in iter_workspace_files(
+            path, skip_dir=lambda name: name.startswith(".")):
+        try:
+            total_size += entry.stat().st_size
+        except OSError:
+            continue
+        file_count += 1
+        # Don't let one huge tree hold up the whole listing
+        if file_count >= FOLDER_STATS_MAX_FILES:
+            break
+    return total_size, file_count
+
+
+def read_text_fast(file_path, size):
+    """Read a UTF-8 text file, using a reusable per-thread buffer when small.
+
+    Small files skip the buffered text I/O stack and its per-file buffer
+    allocation. Decoding is strict and line endings are translated, exactly
+    like open(file_path, "r", encoding="utf-8").read().
+    """
+    buf = getattr(_read_buffers, "buf", None)
+    if buf is None:
+        buf = _read_buffers.buf = bytearray(READ_BUFFER_SIZE)
+
+    if size < len(buf):
+        with open(file_path, "rb", buffering=0) as f:
+            n = f.readinto(buf)
+        # A full buffer means the file grew since it was listed
+        if n < len(buf):
+            with memoryview(buf) as view:
+                text = str(view[:n], "utf-8")
+            if "\r" in text:
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            return text
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _get_cached_context(full_path, digest):
+    """Return a folder's cached /chat contents if its files are unchanged"""
+    cached = _context_cache.pop(full_path, None)
+    if cached is None:
+        return None
+    # Put the folder back as the most recently used entry
+    _context_cache[full_path] = cached
+    return cached[1] if cached[0] == digest else None
+
+
+def _cache_context(full_path, digest, contents):
+    """Cache a folder's /chat contents, replacing any older copy"""
+    global _context_cache_chars
+    old = _context_cache.pop(full_path, None)
+    if old is not None:
+        _context_cache_chars -= old[2]
+    chars = sum(map(len, contents.values()))
+    if chars > CONTEXT_CACHE_MAX_CHARS:
+        return
+    while _context_cache and (
+            len(_context_cache) >= CONTEXT_CACHE_MAX_ENTRIES
+            or _context_cache_chars + chars > CONTEXT_CACHE_MAX_CHARS):
+        _context_cache_chars -= _context_cache.pop(
+            next(iter(_context_cache)))[2]
+    _context_cache[full_path] = (digest, contents, chars)
+    _context_cache_chars += chars
+
+
+def _read_context_file(entry):
+    """Read one file for the /chat context, or None if it can't be read"""
+    try:
+        return read_text_fast(entry.path, entry.stat().st_size)
+    except Exception as e:
+        print(f"Error reading file {entry.path}: {e}")
+        return None
+
+
+def skip_context_dir(name):
+    """Skip .git, node_modules and other hidden or ignored directories"""
+    return name.startswith(".") or name in workspace_manager.SKIP_FOLDERS
+
+
+def count_workspace_files(workspace_path):
+    """Count the files in a workspace using workspace_manager's logic"""
+    total_files = 0
+    for entry, rel_path in iter_workspace_files(workspace_path,
+                                                skip_dir=skip_context_dir):
+        # Filter files based on gitignore and skip patterns
+        if not entry.name.startswith(".") and not entry.name.endswith(
+                SKIP_EXTENSIONS):
+            if not workspace_manager._should_ignore(rel_path):
+                total_files += 1
+    return total_files
+
+
+def workspace_root_mtime():
+    """Return WORKSPACE_ROOT's mtime in nanoseconds"""
+    return os.stat(WORKSPACE_ROOT).st_mtime_ns
+
+
+def sync_workspace_index():
+    """Rebuild the workspace index if WORKSPACE_ROOT changed on disk"""
+    global _workspace_index_mtime
+    root_mtime = workspace_root_mtime()
+    if root_mtime == _workspace_index_mtime:
+        return
+
+    index = []
+    with os.scandir(WORKSPACE_ROOT) as it:
+        for entry in it:
+            # Skip the trash and other hidden entries
+            if entry.name.startswith("."):
+                continue
+            # Follow symlinks so imported workspaces are included
+            if entry.is_dir():
+                index.append((entry.name.lower(), entry.name))
+    index.sort()
+    _workspace_index[:] = index
+    _workspace_index_mtime = root_mtime
+
+
+def update_workspace_index(root_mtime_before, added=None, removed=None):
+    """Apply a workspace create, delete or rename to the sorted index.
+
+    The index is only patched if it was current before the change; otherwise
+    the next history request rebuilds it from disk.
+    """
+    global _workspace_index_mtime
+    if root_mtime_before != _workspace_index_mtime:
+        return
+
+    if removed is not None:
+        key = (removed.lower(), removed)
+        i = bisect.bisect_left(_workspace_index, key)
+        if i < len(_workspace_index) and _workspace_index[i] == key:
+            del _workspace_index[i]
+    if added is not None:
+        key = (added.lower(), added)
+        i = bisect.bisect_left(_workspace_index, key)
+        if i == len(_workspace_index) or _workspace_index[i] != key:
+            _workspace_index.insert(i, key)
+    _workspace_index_mtime = workspace_root_mtime()
+
+
 def get_workspace_history():
     """Get list of all workspaces with their history"""
     workspaces = []
 
-    # List all directories in WORKSPACE_ROOT
-    for item in os.listdir(WORKSPACE_ROOT):
-        workspace_path = os.path.join(WORKSPACE_ROOT, item)
-        if os.path.isdir(workspace_path):
-            # Get directory creation time
-            created_at = datetime.fromtimestamp(
-                os.path.getctime(workspace_path))
-
-            # Count files in workspace using workspace_manager's logic
-            total_files = 0
-            for root, dirs, files in os.walk(workspace_path):
-                # Skip .git and other ignored directories
-                dirs[:] = [
-                    d for d in dirs if not d.startswith(".")
-                    and d not in workspace_manager.SKIP_FOLDERS
-                ]
-
-                # Filter files based on gitignore and skip patterns
-                for file in files:
-                    if not file.startswith(".") and not file.endswith(
-                            tuple(workspace_manager.SKIP_EXTENSIONS)):
-                        rel_path = os.path.relpath(os.path.join(root, file),
-                                                   workspace_path)
-                        if not workspace_manager._should_ignore(rel_path):
-                            total_files += 1
+    # The index is kept sorted alphabetically by ID, case-insensitive
+    sync_workspace_index()
+    for _, workspace_id in _workspace_index:
+        workspace_path = os.path.join(WORKSPACE_ROOT, workspace_id)
+        try:
+            stats = os.stat(workspace_path)
+        except OSError:
+            continue
+
+        # Get directory creation time
+        created_at = datetime.fromtimestamp(stats.st_ctime)
+
+        # Reuse the file count while the workspace directory is unchanged
+        cached = _history_cache.get(workspace_id)
+        if cached and cached[0] == stats.st_mtime_ns:
+            _, total_files, is_imported = cached
+        else:
+            total_files = count_workspace_files(workspace_path)
 
             # Check if this is an imported workspace
             is_imported = os.path.exists(
                 os.path.join(workspace_path, ".imported"))
 
-            workspaces.append({
-                "id": item,
-                "path": workspace_path,
-                "created_at": created_at.isoformat(),
-                "file_count": total_files,
-                "is_imported": is_imported,
-            })
+            _history_cache[workspace_id] = (stats.st_mtime_ns, total_files,
+                                            is_imported)
+
+        workspaces.append({
+            "id": workspace_id,
+            "path": workspace_path,
+            "created_at": created_at.isoformat(),
+            "file_count": total_files,
+            "is_imported": is_imported,
+        })
+
+    return workspaces
+
+
+def move_to_trash(workspace_path):
+    """Move a workspace into the trash, returning its new path or None"""
+    try:
+        os.makedirs(TRASH_DIR, exist_ok=True)
+        trash_path = os.path.join(TRASH_DIR, uuid.uuid4().hex)
+        os.rename(workspace_path, trash_path)
+        return trash_path
+    except OSError as e:
+        # e.g. files held open on Windows; the caller deletes in place
+        print(f"Warning: Could not move {workspace_path} to trash: {e}")
+        return None
+
 
-    # Sort alphabetically by ID, case-insensitive
-    return sorted(workspaces, key=lambda x: x["id"].lower())
+def empty_trash(path=TRASH_DIR):
+    """Remove trashed workspaces without blocking other requests"""
+    # rmtree blocks in system calls, so run it on a native thread instead of
+    # stalling the eventlet hub
+    tpool.execute(shutil.rmtree, path, ignore_errors=True)
 
 
 def delete_workspace(workspace_id):
@@ -349,19 +810,24 @@ def delete_workspace(workspace_id):
     try:
         workspace_path = os.path.join(WORKSPACE_ROOT, workspace_id)
 
-        # Verify the path is within WORKSPACE_ROOT for safety
-        if not os.path.abspath(workspace_path).startswith(
-                os.path.abspath(WORKSPACE_ROOT)):
+        # Verify the path is a workspace directly inside WORKSPACE_ROOT.
+        # A string prefix check would also let "../workspaces_old" through;
+        # the link itself is checked, not the folder an import points to
+        if Path(os.path.abspath(workspace_path)).parent != Path(
+                WORKSPACE_ROOT_ABS):
             raise Exception("Invalid workspace path")
 
+        _history_cache.pop(workspace_id, None)
+        # An imported workspace ID may later point somewhere else
+        real_workspace_dir.cache_clear()
+        root_mtime = workspace_root_mtime()
+
         # Check if it's an imported workspace
         if os.path.exists(os.path.join(workspace_path, ".imported")):
             # Remove the .imported file
             os.remove(os.path.join(workspace_path, ".imported"))
 
             if os.name == "nt":  # Windows
-                import subprocess
-
                 try:
                     # Use rmdir to remove directory junction
                     subprocess.run(["cmd", "/c", "rmdir", workspace_path],
@@ -376,191 +842,107 @@ def delete_workspace(workspace_id):
             # Delete directory for regular workspaces
             try:
                 if os.path.exists(workspace_path):
-                    shutil.rmtree(workspace_path, ignore_errors=False)
+                    trash_path = move_to_trash(workspace_path)
+                    if trash_path:
+                        socketio.start_background_task(empty_trash,
+                                                       trash_path)
+                    else:
+                        shutil.rmtree(workspace_path, ignore_errors=False)
                 if os.path.exists(workspace_path):
                     raise Exception("Failed to delete workspace directory")
             except Exception as e:
                 raise Exception(
                     f"Failed to delete workspace directory: {str(e)}")
 
+        update_workspace_index(root_mtime, removed=workspace_id)
         return True
     except Exception as e:
         raise Exception(f"Failed to delete workspace: {str(e)}")
 
 
-def get_workspace_structure(workspace_dir):
-    structure = []
-
-    # Check if this is an imported workspace
-    is_imported = os.path.exists(os.path.join(workspace_dir, ".imported"))
-
-    for root, dirs, files in os.walk(workspace_dir):
-        rel_path = os.path.relpath(root, workspace_dir)
-        if rel_path == ".":
-            rel_path = ""
-
-        # Skip hidden directories and files
-        dirs[:] = [d for d in dirs if not d.startswith(".")]
-        files = [f for f in files if not f.startswith(".")]
-
-        for name in dirs:
-            full_path = os.path.join(root, name)
-            rel_full_path = os.path.relpath(full_path, workspace_dir)
-
-            structure.append({
-                "name": name,
-                "type": "directory",
-                "path": rel_full_path.replace("\\", "/"),
-                "imported":
-                is_imported,  # Mark all folders as imported if workspace is imported
-            })
-
-        for name in files:
-            full_path = os.path.join(root, name)
-            rel_full_path = os.path.relpath(full_path, workspace_dir)
-
-            structure.append({
-                "name": name,
-                "type": "file",
-                "path": rel_full_path.replace("\\", "/"),
-                "size": get_file_size(full_path),
-            })
-
-    return structure
-
-
-def get_file_size(file_path):
-    """Get the size of a file in bytes"""
+def _walk_structure(dir_path, rel_dir, is_imported):
+    """Collect structure entries for a directory tree in os.walk order"""
+    dirs, files, subdirs = [], [], []
     try:
-        return os.path.getsize(file_path)
-    except OSError:
-        return 0
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                # Skip hidden directories and files
+                if entry.name.startswith("."):
+                    continue
+                # Build the forward-slash path directly instead of joining
+                # and converting separators afterwards
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if is_dir:
+                    dirs.append({
+                        "name": entry.name,
+                        "type": "directory",
+                        "path": rel_path,
+                        "imported":
+                        is_imported,  # Mark all folders as imported if workspace is imported
+                    })
+                    # Like os.walk, list symlinked directories but don't
+                    # descend into them
+                    if not entry.is_symlink():
+                        subdirs.append((entry.path, rel_path))
+                else:
+                    try:
+                        size = entry.stat().st_size
+                    except OSError:
+                        size = 0
+                    files.append({
+                        "name": entry.name,
+                        "type": "file",
+                        "path": rel_path,
+                        "size": size,
+                    })
+    except OSError as e:
+        print(f"Warning: Could not scan directory {dir_path}: {e}")
 
+    structure = dirs + files
+    for sub_path, sub_rel in subdirs:
+        structure.extend(_walk_structure(sub_path, sub_rel, is_imported))
+    return structure
 
-def read_file_in_chunks(file_path, chunk_size=8192):
-    """Generator to read a file in chunks"""
-    with open(file_path, "r", encoding="utf-8") as f:
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
-                break
-            yield chunk
 
+def get_workspace_structure(workspace_dir):
+    # Check if this is an imported workspace once for the whole tree
+    is_imported = os.path.exists(os.path.join(workspace_dir, ".imported"))
 
-def is_large_file(file_path, threshold_mb=5):
-    """Check if a file is considered large (default threshold: 5MB)"""
-    return get_file_size(file_path) > (threshold_mb * 1024 * 1024)
+    # scandir blocks, so walk on one of eventlet's native threads to keep
+    # the hub serving other requests meanwhile
+    return tpool.execute(_walk_structure, workspace_dir, "", is_imported)
 
 
-def get_file_preview(file_path, max_lines=1000):
-    """Get a preview of a large file (first max_lines lines)"""
-    preview_lines = []
-    try:
-        # First try UTF-8
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                for i, line in enumerate(f):
-                    if i >= max_lines:
-                        preview_lines.append(
-                            "... (file truncated, too large to display completely)"
-                        )
-                        break
-                    preview_lines.append(line.rstrip("\n"))
-        except UnicodeDecodeError:
-            # If UTF-8 fails, try to detect if it's a binary file
-            with open(file_path, "rb") as f:
-                is_binary = False
-                try:
-                    chunk = f.read(1024)
-                    if b"\x00" in chunk:
-                        is_binary = True
-                    # Try to decode as latin-1 which can handle all byte values
-                    text = chunk.decode("latin-1")
-                    if any(ord(c) < 32 and c not in "\r\n\t" for c in text):
-                        is_binary = True
-                except BaseException:
-                    is_binary = True
-
-                if is_binary:
-                    return "[Binary file] - Cannot display content"
-
-                # If not binary, try reading with latin-1 encoding
-                f.seek(0)
-                with open(file_path, "r", encoding="latin-1") as f:
-                    for i, line in enumerate(f):
-                        if i >= max_lines:
-                            preview_lines.append(
-                                "... (file truncated, too large to display completely)"
-                            )
-                            break
-                        preview_lines.append(line.rstrip("\n"))
-
-        return "\n".join(preview_lines)
-    except Exception as e:
-        return f"Error reading file: {str(e)}"
+def _read_batch(read_one, batch):
+    """Apply read_one to a batch of argument tuples in order"""
+    return [read_one(*args) for args in batch]
 
 
-def get_existing_files(workspace_dir):
-    """Get content of existing files in workspace"""
-    # Validate workspace directory
-    if not os.path.exists(workspace_dir) or not os.path.isdir(workspace_dir):
-        raise ValueError("Invalid workspace directory")
+def map_file_reads(read_one, candidates):
+    """Apply read_one to each argument tuple on eventlet's native threads.
 
-    # Set maximum file size (50MB)
-    MAX_FILE_SIZE = 50 * 1024 * 1024
+    Candidates are split into contiguous batches, one native thread each, so
+    blocking file I/O overlaps without stalling the hub. Results come back in
+    candidate order.
+    """
+    if not candidates:
+        return []
 
-    files_content = {}
-    for root, _, files in os.walk(workspace_dir):
-        for file in files:
-            # Skip database, hidden files, and common binary formats
-            if (not file.endswith(".db") and not file.startswith(".")
-                    and not file.endswith((".pyc", ".pyo", ".pyd", ".so",
-                                           ".dll", ".exe", ".bin"))):
-
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, workspace_dir)
-                try:
-                    # Get file size
-                    file_size = os.path.getsize(file_path)
-                    if file_size > MAX_FILE_SIZE:
-                        print(
-                            f"Warning: Skipping large file {rel_path} ({file_size} bytes)"
-                        )
-                        continue
-
-                    # Check if it's a large file
-                    if is_large_file(file_path):
-                        # For large files, only get a preview
-                        preview = get_file_preview(file_path)
-                        if preview.startswith("[Binary file]"):
-                            continue  # Skip binary files
-                        files_content[rel_path] = preview
-                    else:
-                        # Try UTF-8 first
-                        try:
-                            with open(file_path, "r", encoding="utf-8") as f:
-                                content = f.read()
-                        except UnicodeDecodeError:
-                            # Check if binary
-                            with open(file_path, "rb") as f:
-                                chunk = f.read(1024)
-                                if b"\x00" in chunk:
-                                    continue  # Skip binary files
-
-                                # Try latin-1 as fallback
-                                try:
-                                    with open(file_path,
-                                              "r",
-                                              encoding="latin-1") as f:
-                                        content = f.read()
-                                except BaseException:
-                                    continue  # Skip if still can't read
-
-                        files_content[rel_path] = content
-                except Exception as e:
-                    print(f"Warning: Could not read file {file_path}: {e}")
-                    continue
-    return files_content
+    batch_size = -(-len(candidates) // FILE_READ_WORKERS)
+    batches = [
+        candidates[i:i + batch_size]
+        for i in range(0, len(candidates), batch_size)
+    ]
+    with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+        results = executor.map(
+            lambda batch: tpool.execute(_read_batch, read_one, batch),
+            batches)
+        return [result for batch in results for result in batch]
 
 
 @app.route("/workspace/create", methods=["POST"])
@@ -619,13 +1001,12 @@ def expand_directory():
         page = int(data.get("page", 1))
         page_size = int(data.get("page_size", 100))
 
-        print("\nExpanding directory request:")  # Debug log
-        print(f"Workspace: {workspace_dir}")
-        print(f"Directory: {dir_path}")
-        print(f"Page: {page}, Page Size: {page_size}")
+        logger.debug(
+            "Expanding directory request: workspace %s, directory %s, "
+            "page %s, page size %s", workspace_dir, dir_path, page, page_size)
 
         if not workspace_dir or not os.path.exists(workspace_dir):
-            print(f"Invalid workspace directory: {workspace_dir}")  # Debug log
+            logger.debug("Invalid workspace directory: %s", workspace_dir)
             return (
                 jsonify({
                     "status": "error",
@@ -635,7 +1016,7 @@ def expand_directory():
             )
 
         if not dir_path:
-            print("No directory path provided")  # Debug log
+            logger.debug("No directory path provided")
             return (
                 jsonify({
                     "status": "error",
@@ -651,8 +1032,8 @@ def expand_directory():
                 page_size=page_size,
                 page=page,
             )
-            # Debug log
-            print(f"Expansion successful: {len(result['items'])} items")
+            logger.debug("Expansion successful: %d items",
+                         len(result["items"]))
             return jsonify({
                 "status": "success",
                 "items": result["items"],
@@ -686,6 +1067,10 @@ def process_prompt():
         model_id = data.get("model_id")
         attachments = data.get("attachments", [])
         context_path = data.get("context_path")  # Get the context path
+        # Socket.io sid of the requesting page, which gets the streamed reply
+        socket_sid = data.get("socket_id")
+        # Set to ask the model again, replacing any cached suggestions
+        no_cache = bool(data.get("no_cache"))
 
         if not prompt:
             return jsonify({
@@ -746,10 +1131,30 @@ def process_prompt():
                         "content"]
 
         # Get suggestions from AI
-        suggestions = get_code_suggestion(prompt=prompt,
+        def generate():
+            return get_code_suggestion(prompt=prompt,
                                        files_content=files_content,
                                        model_id=model_id,
-                                       workspace_context=None)
+                                       workspace_context=None,
+                                       socket_sid=socket_sid)
+
+        model_config = get_model_config(model_id)
+        if (model_config is None
+                or code_suggestion_temperature(model_config) != 0):
+            # Sampled suggestions differ from run to run, so aren't cached
+            suggestions, cached = generate(), False
+        else:
+            # Reuse suggestions for a repeated prompt over unchanged files;
+            # an identical request that is still running is waited for
+            # rather than sent to the model a second time
+            cache_key = prompt_cache.make_key(prompt, files_content, model_id)
+            suggestions, cached = prompt_cache.get_or_generate(
+                cache_key, generate, refresh=no_cache)
+        if cached:
+            socketio.emit("status", {
+                "message": "Using cached suggestions...",
+                "step": 2
+            }, to=socket_sid)
 
         if not suggestions or "operations" not in suggestions:
             return (
@@ -775,14 +1180,14 @@ def process_prompt():
                 if "content" not in operation:
                     operation["content"] = diff_info["new_content"]
 
-                print(f"Generated diff for {operation['path']}:")
-                print(diff_info["diff"])
+                logger.debug("Generated diff for %s:\n%s",
+                             operation["path"], diff_info["diff"])
 
         # Apply changes if no approval needed
         if not suggestions.get("requires_approval", True):
             results = apply_changes(suggestions, workspace_dir)
             structure = workspace_manager.get_workspace_structure(
-                workspace_dir)
+                workspace_dir, run=tpool.execute)
 
             return jsonify({
                 "status": "success",
@@ -805,6 +1210,13 @@ def process_prompt():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route("/prompt-cache/clear", methods=["POST"])
+def clear_prompt_cache():
+    """Forget every cached suggestion, in memory and on disk"""
+    prompt_cache.clear()
+    return jsonify({"status": "success"})
+
+
 @app.route("/workspace/delete", methods=["POST"])
 def delete_workspace_endpoint():
     try:
@@ -823,6 +1235,22 @@ def delete_workspace_endpoint():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@lru_cache(maxsize=256)
+def real_workspace_dir(workspace_dir):
+    """Resolve a workspace directory once and reuse it across requests"""
+    return os.path.realpath(workspace_dir)
+
+
+def is_within_workspace(path, workspace_dir):
+    """Check that path resolves to workspace_dir or somewhere inside it"""
+    root = real_workspace_dir(workspace_dir)
+    try:
+        return os.path.commonpath([root, os.path.realpath(path)]) == root
+    except ValueError:
+        # Paths on different drives
+        return False
+
+
 @app.route("/workspace/file", methods=["POST"])
 def get_file_content():
     try:
@@ -849,12 +1277,10 @@ def get_file_content():
         # Get the full path by joining workspace_dir and file_path
         full_path = os.path.normpath(os.path.join(workspace_dir, file_path))
 
-        print(f"Workspace: {workspace_dir}")  # Debug log
-        print(f"File path: {file_path}")  # Debug log
-        print(f"Full path: {full_path}")  # Debug log
+        logger.debug("Workspace: %s, file path: %s, full path: %s",
+                     workspace_dir, file_path, full_path)
 
-        if not os.path.abspath(full_path).startswith(
-                os.path.abspath(workspace_dir)):
+        if not is_within_workspace(full_path, workspace_dir):
             return (
                 jsonify({
                     "status": "error",
@@ -863,8 +1289,11 @@ def get_file_content():
                 400,
             )
 
-        if not os.path.exists(full_path):
-            print(f"File not found: {full_path}")  # Debug log
+        # One stat serves the existence check, the size and the cache check
+        try:
+            stats = os.stat(full_path)
+        except OSError:
+            logger.debug("File not found: %s", full_path)
             return jsonify({
                 "status": "success",
                 "content": "",  # Return empty content for new files
@@ -873,9 +1302,9 @@ def get_file_content():
             })
 
         # Use workspace manager to get file content
-        content = workspace_manager._get_file_content(full_path)
-        file_size = os.path.getsize(full_path)
-        is_large = workspace_manager.is_large_file(full_path)
+        content = workspace_manager._get_file_content(full_path, stats=stats)
+        file_size = stats.st_size
+        is_large = workspace_manager.is_large_file_by_size(file_size)
 
         return jsonify({
             "status": "success",
@@ -926,7 +1355,14 @@ def rename_workspace():
             )
 
         # Rename directory
+        root_mtime = workspace_root_mtime()
         os.rename(old_path, new_path)
+        _history_cache.pop(workspace_id, None)
+        # A new or imported workspace may reuse the old name
+        real_workspace_dir.cache_clear()
+        update_workspace_index(root_mtime,
+                               added=new_name,
+                               removed=workspace_id)
 
         return jsonify({
             "status": "success",
@@ -947,6 +1383,8 @@ def chat():
         model_id = data.get("model_id")
         attachments = data.get("attachments", [])
         context_path = data.get("context_path")  # Get the context path
+        # Socket.io sid of the requesting page, which gets the streamed reply
+        socket_sid = data.get("socket_id")
 
         if not prompt:
             return jsonify({"error": "No prompt provided"}), 400
@@ -966,22 +1404,45 @@ def chat():
                     with open(full_path, "r", encoding="utf-8") as f:
                         files_content = {context_path: f.read()}
                 else:
-                    # For a directory, get contents of files within it
-                    files_content = {}
-                    for root, _, files in os.walk(full_path):
-                        for file in files:
-                            if not file.startswith(".") and not file.endswith(
-                                    tuple(workspace_manager.SKIP_EXTENSIONS)):
-                                file_path = os.path.join(root, file)
-                                rel_path = os.path.relpath(
-                                    file_path, workspace_dir)
-                                try:
-                                    with open(file_path, "r",
-                                              encoding="utf-8") as f:
-                                        files_content[rel_path] = f.read()
-                                except Exception as e:
-                                    print(
-                                        f"Error reading file {file_path}: {e}")
+                    # For a directory, get contents of files within it.
+                    # Collect the files first, then read them concurrently.
+                    candidates = []
+                    rel_paths = []
+                    fingerprint = hashlib.blake2b(digest_size=16)
+                    rel_root = os.path.relpath(full_path, workspace_dir)
+                    for entry, rel_path in iter_workspace_files(
+                            full_path, skip_dir=skip_context_dir):
+                        file = entry.name
+                        if not file.startswith(".") and not file.endswith(
+                                SKIP_EXTENSIONS):
+                            if rel_root != ".":
+                                rel_path = f"{rel_root}{os.sep}{rel_path}"
+                            try:
+                                stats = entry.stat()
+                            except OSError as e:
+                                print(f"Error reading file {entry.path}: {e}")
+                                continue
+                            fingerprint.update(
+                                f"{rel_path}\0{stats.st_mtime_ns}\0{stats.st_size}\0"
+                                .encode("utf-8", "surrogateescape"))
+                            candidates.append((entry, ))
+                            rel_paths.append(rel_path)
+
+                    # Reuse the folder's contents while no file in it has
+                    # been added, removed or modified
+                    digest = fingerprint.digest()
+                    cached = _get_cached_context(full_path, digest)
+                    if cached is None:
+                        cached = {}
+                        for rel_path, content in zip(
+                                rel_paths,
+                                map_file_reads(_read_context_file,
+                                               candidates)):
+                            if content is not None:
+                                cached[rel_path] = content
+                        _cache_context(full_path, digest, cached)
+                    # Attachments are added below, so work on a copy
+                    files_content = dict(cached)
         else:
             # No context path, get relevant files based on the query
             files_content = workspace_manager.get_workspace_files(
@@ -995,9 +1456,10 @@ def chat():
                         "content"]
 
         # Build context from files
-        context = "Here are the relevant files in the workspace:\n\n"
+        context_parts = ["Here are the relevant files in the workspace:\n\n"]
         for file_path, content in files_content.items():
-            context += f"File: {file_path}\nContent:\n{content}\n\n"
+            context_parts.append(f"File: {file_path}\nContent:\n{content}\n\n")
+        context = "".join(context_parts)
 
         # Construct a more focused system message based on context
         if context_path:
@@ -1016,7 +1478,8 @@ Please provide helpful responses focused on this {context_type} and its contents
 
 Please provide helpful responses about the code and files in this workspace."""
 
-        response = get_chat_response(system_message, prompt, model_id)
+        response = get_chat_response(system_message, prompt, model_id,
+                                     socket_sid)
 
         return jsonify({"status": "success", "response": response})
 
@@ -1024,21 +1487,235 @@ Please provide helpful responses about the code and files in this workspace."""
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-def get_chat_response(system_message, user_message, model_id):
+# Translation tables for rendering chat replies as HTML in one pass
+_BR = str.maketrans({"\n": "<br>"})
+_BR_NBSP = str.maketrans({"\n": "<br>", " ": "&nbsp;"})
+
+
+CHAT_FENCE = "```"
+
+
+def _format_chat_part(text, start, end, in_code):
+    """Render text[start:end], one plain or fenced slice of a chat reply"""
+    if not in_code:  # Regular text
+        # Replace newlines with <br> in regular text
+        return text[start:end].translate(_BR)
+    # Code block: extract language if specified
+    newline = text.find("\n", start, end)
+    if newline != -1:
+        lang = text[start:newline]
+        # Remove trailing whitespace and newlines, preserve indentation
+        formatted_code = text[newline + 1:end].rstrip().translate(_BR_NBSP)
+        return f'<pre><code class="language-{lang.strip()}">{formatted_code}</code></pre>'
+    # Single line code block, remove trailing whitespace
+    return f'<pre><code>{text[start:end].strip().translate(_BR_NBSP)}</code></pre>'
+
+
+def format_chat_response(text):
+    """Render ``` fenced code blocks and line breaks in a chat reply as HTML"""
+    formatted_parts = []
+    pos = 0
+    in_code = False
+    # Walk the fences once instead of splitting the reply into copies;
+    # an unclosed fence turns the rest of the reply into code
+    while True:
+        next_fence = text.find(CHAT_FENCE, pos)
+        end = len(text) if next_fence == -1 else next_fence
+        formatted_parts.append(_format_chat_part(text, pos, end, in_code))
+        if next_fence == -1:
+            break
+        pos = next_fence + len(CHAT_FENCE)
+        in_code = not in_code
+
+    return "".join(formatted_parts)
+
+
+class ChatStreamFormatter:
+    """Format a chat reply as it streams in, matching format_chat_response"""
+
+    def __init__(self):
+        self.pending = ""  # Unformatted tail: an open code block or backticks
+        self.in_code = False
+
+    def feed(self, chunk):
+        """Return the HTML that can be rendered once chunk is added"""
+        text = self.pending + chunk
+        # Earlier text was already searched, except where a fence could
+        # straddle the chunk boundary
+        search_from = max(len(self.pending) - len(CHAT_FENCE) + 1, 0)
+        formatted_parts = []
+        pos = 0
+        while True:
+            next_fence = text.find(CHAT_FENCE, search_from)
+            if next_fence == -1:
+                break
+            formatted_parts.append(
+                _format_chat_part(text, pos, next_fence, self.in_code))
+            pos = search_from = next_fence + len(CHAT_FENCE)
+            self.in_code = not self.in_code
+
+        if not self.in_code:
+            # Plain text can go out now, except backticks that may turn
+            # out to open a fence
+            end = len(text)
+            while end > pos and text[end - 1] == "`":
+                end -= 1
+            if end > pos:
+                formatted_parts.append(
+                    _format_chat_part(text, pos, end, False))
+                pos = end
+        self.pending = text[pos:]
+        return "".join(formatted_parts)
+
+    def close(self):
+        """Return the HTML for whatever is left at the end of the reply"""
+        text, self.pending = self.pending, ""
+        if not text and not self.in_code:
+            return ""
+        return _format_chat_part(text, 0, len(text), self.in_code)
+
+
+def _openai_stream_text(response):
+    """Yield the text of each chunk in an OpenAI-compatible stream"""
+    for chunk in response:
+        if (chunk and hasattr(chunk.choices[0], "delta")
+                and hasattr(chunk.choices[0].delta, "content")):
+            content = chunk.choices[0].delta.content
+            if content is not None:
+                yield content
+
+
+def _gemini_send(client, chat, content, max_output_tokens, temperature):
+    """Send a Gemini chat message without blocking the eventlet hub"""
+    # google-generativeai talks gRPC, which monkey patching can't make
+    # cooperative, so the call runs on a native thread
+    return tpool.execute(
+        chat.send_message,
+        content,
+        generation_config=client.types.GenerationConfig(
+            temperature=temperature,
+            candidate_count=1,
+            max_output_tokens=max_output_tokens),
+    )
+
+
+def has_socket_listeners(room=None):
+    """Whether any socket.io client is connected to receive broadcasts.
+
+    With a room, only clients in that room count.
+    """
+    # Clients of the other processes sharing a message queue aren't visible
+    if SOCKETIO_MESSAGE_QUEUE:
+        return True
+    # Every connected client sits in the namespace's None room
+    return bool(socketio.server.manager.rooms.get("/", {}).get(room))
+
+
+class ChunkBatcher:
+    """Coalesce streamed text into fewer socket.io events"""
+
+    def __init__(self, send, to=None):
+        self.send = send  # Called with the batched text and total chars
+        # socket.io sid of the requesting client. Streamed text is private to
+        # it, so with no sid nothing is sent rather than broadcast
+        self.to = to
+        self.parts = []
+        self.chars = 0
+        self.last_flush = time.time()
+
+    def add(self, text):
+        if self.to is None:
+            return
+        self.parts.append(text)
+        self.chars += len(text)
+        if (len(self.parts) >= CHUNK_EMIT_MAX_CHUNKS
+                or time.time() - self.last_flush >= CHUNK_EMIT_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        """Send whatever text is held back"""
+        if self.parts:
+            text = "".join(self.parts)
+            self.parts.clear()
+            # Nobody would receive the event, so don't build it
+            if has_socket_listeners(self.to):
+                self.send(text, self.chars)
+        self.last_flush = time.time()
+
+
+def _consume_stream(texts, start_time, message, on_text=None, to=None):
+    """Collect streamed model text, reporting progress over socket.io.
+
+    Progress goes to the client with socket.io sid to, or to everyone when
+    it is None.
+    """
+    chunks = []
+    total_chars = 0
+    last_update = time.time()
+    last_update_chars = 0
+    # Reused for every progress event instead of rebuilt each time
+    status = {"step": 2, "progress": {}}
+    # Bound once so the per-chunk loop uses locals, not global lookups
+    now = time.time
+    sleep = socketio.sleep
+    emit = socketio.emit
+    has_listeners = has_socket_listeners
+    append = chunks.append
+
+    for content in texts:
+        # Buffered chunks are decoded back to back without touching the
+        # network; yield so other greenlets and emits get a turn
+        sleep(0)
+        append(content)
+        total_chars += len(content)
+        if on_text is not None:
+            on_text(content, total_chars)
+
+        current_time = now()
+        update_interval = (STATUS_UPDATE_INTERVAL_LARGE
+                           if total_chars >= STATUS_LARGE_RESPONSE_CHARS else
+                           STATUS_UPDATE_INTERVAL)
+        if (current_time - last_update >= update_interval
+                and total_chars - last_update_chars >= STATUS_MIN_NEW_CHARS):
+            chunk_count = len(chunks)
+            elapsed = current_time - start_time
+            tokens_per_second = chunk_count / elapsed if elapsed > 0 else 0
+            print(
+                f"\rReceived {chunk_count} chunks ({total_chars} chars) in {elapsed:.1f}s ({tokens_per_second:.1f} chunks/s)",
+                end="",
+            )
+            if has_listeners(to):
+                status["message"] = f"{message} ({total_chars} characters)"
+                status["progress"].update(chunks=chunk_count,
+                                          chars=total_chars,
+                                          elapsed=elapsed,
+                                          rate=tokens_per_second)
+                emit("status", status, to=to)
+            last_update = current_time
+            last_update_chars = total_chars
+
+    text = "".join(chunks)
+    print(f"\nResponse complete in {time.time() - start_time:.1f}s")
+    print(f"Total response size: {len(text)} characters in {len(chunks)} chunks")
+    return text
+
+
+def get_chat_response(system_message, user_message, model_id,
+                      socket_sid=None):
     """Get a chat response from the selected AI model"""
-    if model_id not in model_clients:
+    model_config = get_model_config(model_id)
+    if model_config is None:
         raise Exception(
             f"Model {model_id} is not configured. Please check your API keys.")
 
-    client = model_clients[model_id]
-    model_config = AVAILABLE_MODELS[model_id]
+    client = model_config.client
 
     try:
         print("\n=== Step 1: Preparing Chat Request ===")
         print(f"Model: {model_id}")
 
         # Create messages array for the chat
-        if model_id == "o1-mini" or model_id == "o1":
+        if model_config.system_in_user:
             # For o1 model, combine system message and user message
             messages = [{
                 "role":
@@ -1059,16 +1736,15 @@ def get_chat_response(system_message, user_message, model_id):
             ]
 
         # Estimate tokens in messages
-        system_tokens = len(
-            system_message.encode("utf-8")) // 4  # Rough estimate
-        user_tokens = len(user_message.encode("utf-8")) // 4
+        system_tokens = estimate_tokens(system_message)  # Rough estimate
+        user_tokens = estimate_tokens(user_message)
         total_tokens = system_tokens + user_tokens
 
         # If total tokens exceed model's limit, truncate the system message
-        max_tokens = model_config.get("max_tokens", 100000)
+        max_tokens = model_config.max_tokens
         if total_tokens > max_tokens:
             # Keep user message intact, truncate system message
-            available_tokens = max_tokens - user_tokens - 1000  # Leave some buffer
+            available_tokens = max_tokens - user_tokens - PROMPT_TOKEN_RESERVE
             if available_tokens > 0:
                 # Use workspace manager's truncation method
                 system_message = workspace_manager._truncate_content_for_context(
@@ -1087,45 +1763,62 @@ def get_chat_response(system_message, user_message, model_id):
         socketio.emit("status", {
             "message": "Sending chat request to AI model...",
             "step": 1
-        })
+        }, to=socket_sid)
 
         start_time = time.time()
         print("\n=== Step 2: Sending Request to AI Model ===")
 
-        if model_id == "claude":
+        # Formatted HTML goes to the client as a streamed reply comes in
+        formatter = ChatStreamFormatter()
+        formatted_parts = []
+        html_batcher = ChunkBatcher(
+            lambda html, chars: socketio.emit(
+                "chat_chunk", {"html": html}, to=socket_sid),
+            to=socket_sid)
+
+        def send_formatted(content, total_chars):
+            html = formatter.feed(content)
+            if html:
+                formatted_parts.append(html)
+                html_batcher.add(html)
+
+        streamed = model_config.kind is not ModelKind.GENAI
+        if model_config.kind is ModelKind.ANTHROPIC:
             # Use Anthropic's client interface
-            response = client.messages.create(
-                model=model_config["models"]["chat"],
-                messages=[{
-                    "role":
-                    "user",
-                    "content":
-                    f"{system_message}\n\nUser request: {user_message}",
-                }],
-                temperature=0.7,
-                max_tokens=4096,
-            )
-            if not response or not response.content:
+            with client.messages.stream(
+                    model=model_config.chat_model,
+                    messages=[{
+                        "role":
+                        "user",
+                        "content":
+                        f"{system_message}\n\nUser request: {user_message}",
+                    }],
+                    temperature=0.7,
+                    max_tokens=4096,
+            ) as stream:
+                print("Request sent, waiting for response...")
+                socketio.emit("status", {
+                    "message": "Receiving AI response...",
+                    "step": 2
+                }, to=socket_sid)
+                text = _consume_stream(stream.text_stream, start_time,
+                                       "Receiving chat response...",
+                                       send_formatted, socket_sid)
+            if not text:
                 raise Exception("Empty response from Claude")
-            text = response.content[0].text
-            print(f"\nResponse received in {time.time() - start_time:.1f}s")
-            print(f"Response length: {len(text)} characters")
-        elif model_id == "gemini":
+        elif model_config.kind is ModelKind.GENAI:
             # Use the Google AI client
             try:
-                model = client.GenerativeModel("gemini-2.0-flash-exp")
+                model = client.GenerativeModel(model_config.chat_model)
                 chat = model.start_chat(history=[])
 
-                # Combine all messages into a single context
-                full_context = "\n\n".join(msg["content"] for msg in messages)
+                # Combine all messages into a single context; the parts are
+                # kept so a retry only replaces the messages it truncates
+                context_parts = [msg["content"] for msg in messages]
+                full_context = "\n\n".join(context_parts)
 
-                response = chat.send_message(
-                    full_context,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.1,
-                        candidate_count=1,
-                        max_output_tokens=8192),
-                )
+                response = _gemini_send(client, chat, full_context, 8192,
+                                        0.1)
 
                 if not response or not response.text:
                     raise Exception("Empty response from Gemini")
@@ -1142,22 +1835,16 @@ def get_chat_response(system_message, user_message, model_id):
                     # Try again with more aggressive truncation
                     for i in range(len(messages) - 1):
                         if messages[i]["role"] == "system":
-                            messages[i]["content"] = (
+                            messages[i]["content"] = context_parts[i] = (
                                 workspace_manager.
                                 _truncate_content_for_context(
                                     messages[i]["content"],
                                     max_tokens=10000,  # Even more conservative
                                 ))
                     # Combine truncated messages
-                    full_context = "\n\n".join(msg["content"]
-                                               for msg in messages)
-                    response = chat.send_message(
-                        full_context,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.1,
-                            candidate_count=1,
-                            max_output_tokens=4096),
-                    )
+                    full_context = "\n\n".join(context_parts)
+                    response = _gemini_send(client, chat, full_context,
+                                            4096, 0.1)
                     if not response or not response.text:
                         raise Exception(
                             "Empty response from Gemini after truncation")
@@ -1167,9 +1854,9 @@ def get_chat_response(system_message, user_message, model_id):
         else:
             # Use streaming for other OpenAI-compatible models
             response = client.chat.completions.create(
-                model=model_config["models"]["chat"],
+                model=model_config.chat_model,
                 messages=messages,
-                temperature=1 if model_id in ["o1-mini", "o1"] else 0.7,
+                temperature=1 if model_config.system_in_user else 0.7,
                 stream=True,
             )
 
@@ -1177,91 +1864,45 @@ def get_chat_response(system_message, user_message, model_id):
             socketio.emit("status", {
                 "message": "Receiving AI response...",
                 "step": 2
-            })
+            }, to=socket_sid)
 
-            # Process the streamed response
-            text = ""
-            chunk_count = 0
-            last_update = time.time()
-            update_interval = 0.5
-
-            for chunk in response:
-                if (chunk and hasattr(chunk.choices[0], "delta")
-                        and hasattr(chunk.choices[0].delta, "content")):
-                    content = chunk.choices[0].delta.content
-                    if content is not None:
-                        text += content
-                        chunk_count += 1
-
-                    current_time = time.time()
-                    if current_time - last_update >= update_interval:
-                        elapsed = current_time - start_time
-                        tokens_per_second = chunk_count / elapsed if elapsed > 0 else 0
-                        print(
-                            f"\rReceived {chunk_count} chunks ({len(text)} chars) in {elapsed:.1f}s ({tokens_per_second:.1f} chunks/s)",
-                            end="",
-                        )
-                        socketio.emit(
-                            "status",
-                            {
-                                "message":
-                                f"Receiving chat response... ({len(text)} characters)",
-                                "step": 2,
-                                "progress": {
-                                    "chunks": chunk_count,
-                                    "chars": len(text),
-                                    "elapsed": elapsed,
-                                    "rate": tokens_per_second,
-                                },
-                            },
-                        )
-                        last_update = current_time
-
-            print(f"\nResponse complete in {time.time() - start_time:.1f}s")
-            print(
-                f"Total response size: {len(text)} characters in {chunk_count} chunks"
-            )
+            text = _consume_stream(_openai_stream_text(response), start_time,
+                                   "Receiving chat response...",
+                                   send_formatted, socket_sid)
 
         print("\n=== Step 3: Formatting Response ===")
         socketio.emit("status", {
             "message": "Formatting response...",
             "step": 3
-        })
-
-        # Split text into code blocks and regular text
-        parts = text.split("```")
-        formatted_parts = []
+        }, to=socket_sid)
 
-        for i, part in enumerate(parts):
-            if i % 2 == 0:  # Regular text
-                # Replace newlines with <br> in regular text
-                formatted_parts.append(part.replace("\n", "<br>"))
-            else:  # Code block
-                # Extract language if specified
-                if "\n" in part:
-                    lang, code = part.split("\n", 1)
-                    # Remove trailing whitespace and newlines, preserve
-                    # indentation
-                    formatted_code = (code.rstrip().replace("\n",
-                                                            "<br>").replace(
-                                                                " ", "&nbsp;"))
-                    formatted_parts.append(
-                        f'<pre><code class="language-{lang.strip()}">{formatted_code}</code></pre>'
-                    )
-                else:
-                    # Single line code block, remove trailing whitespace
-                    formatted_parts.append(
-                        f'<pre><code>{part.strip().replace(" ", "&nbsp;")}</code></pre>'
-                    )
-
-        formatted_text = "".join(formatted_parts)
+        if not streamed:
+            # Replies that weren't streamed are formatted and sent whole
+            formatted_text = format_chat_response(text)
+            socketio.emit("chat_chunk", {"html": formatted_text},
+                          to=socket_sid)
+        else:
+            html = formatter.close()
+            if html:
+                formatted_parts.append(html)
+                html_batcher.add(html)
+            html_batcher.flush()
+            formatted_text = "".join(formatted_parts)
         print("Response formatting complete")
 
-        socketio.emit("status", {"message": "Response ready", "step": 4})
+        socketio.emit("chat_done", {"chars": len(formatted_text)},
+                      to=socket_sid)
+        socketio.emit("status", {
+            "message": "Response ready",
+            "step": 4
+        }, to=socket_sid)
         return formatted_text
 
     except Exception as e:
-        socketio.emit("status", {"message": f"Error: {str(e)}", "step": -1})
+        socketio.emit("status", {
+            "message": f"Error: {str(e)}",
+            "step": -1
+        }, to=socket_sid)
         print(f"\nError getting chat response: {str(e)}")
         raise
 
@@ -1269,29 +1910,40 @@ def get_chat_response(system_message, user_message, model_id):
 @app.route("/models", methods=["GET"])
 def get_available_models():
     """Get list of available and configured models"""
-    configured_models = []
-    for model_id, config in AVAILABLE_MODELS.items():
-        if model_id in model_clients:
-            configured_models.append({"id": model_id, "name": config["name"]})
+    configured_models = [{
+        "id": model_id,
+        "name": config.name
+    } for model_id, config in MODEL_REGISTRY.items()]
     return jsonify({"status": "success", "models": configured_models})
 
 
 @app.route("/logo.svg")
 def serve_logo():
-    return send_from_directory("static", "logo.svg", mimetype="image/svg+xml")
+    return send_from_directory("static",
+                               "logo.svg",
+                               mimetype="image/svg+xml",
+                               conditional=True,
+                               max_age=ICON_MAX_AGE)
 
 
 @app.route("/favicon.png")
 def serve_favicon():
     return send_from_directory("static",
                                "favicon.svg",
-                               mimetype="image/svg+xml")
+                               mimetype="image/svg+xml",
+                               conditional=True,
+                               max_age=ICON_MAX_AGE)
 
 
 @app.route("/apply_changes", methods=["POST"])
 def apply_changes_endpoint():
     try:
-        data = request.json
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({
+                "status": "error",
+                "message": "Invalid JSON body"
+            }), 400
         workspace_dir = data.get("workspace_dir")
         operations = data.get("operations", [])
 
@@ -1313,161 +1965,172 @@ def apply_changes_endpoint():
                 400,
             )
 
+        # Fail fast on a missing or unreadable workspace with a single stat
+        try:
+            is_dir = stat.S_ISDIR(os.stat(workspace_dir).st_mode)
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            return (
+                jsonify({
+                    "status": "error",
+                    "message": "Invalid workspace directory"
+                }),
+                400,
+            )
+
         # Apply the changes
         results = apply_changes({"operations": operations}, workspace_dir)
-
-        # Get updated workspace structure
-        structure = workspace_manager.get_workspace_structure(workspace_dir)
-
+        response = {"status": "success", "results": results}
+
+        # The updated tree is only walked for clients that ask for it with
+        # ?structure=1; changes_applied already lists the modified files
+        if request.args.get("structure", "0") == "1":
+            # Walk on a native thread, so the hub keeps flushing the
+            # changes_applied event and serving other clients meanwhile
+            response["structure"] = workspace_manager.get_workspace_structure(
+                workspace_dir, run=tpool.execute)
+
+        return jsonify(response)
+
+    except Exception:
+        # Per-operation errors are reported in the results, so this is
+        # only reached by unexpected failures. The message may embed whole
+        # operations, so keep it to the log
+        logger.exception("Error applying changes")
         return jsonify({
-            "status": "success",
-            "structure": structure,
-            "results": results
-        })
+            "status": "error",
+            "message": "Failed to apply changes"
+        }), 500
 
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+
+# Query string that makes browsers refetch static files after a restart
+CACHE_BUSTER = str(int(time.time()))
 
 
 @app.context_processor
 def utility_processor():
     """Add utility functions to template context"""
-    return {"cache_buster": str(int(datetime.now().timestamp()))}
-
-
-def get_workspace_context(workspace_dir):
-    """Get a description of the workspace context"""
-    structure = get_workspace_structure(workspace_dir)
-    files_content = get_existing_files(workspace_dir)
-
-    context = "Workspace Structure:\n"
-    for item in structure:
-        prefix = "📁 " if item["type"] == "directory" else " "
-        context += f"{prefix}{item['path']}\n"
-
-    context += "\nFile Relationships and Dependencies:\n"
-    # Analyze imports and dependencies
-    dependencies = analyze_dependencies(files_content)
-    for file, deps in dependencies.items():
-        if deps:
-            context += f"{file} depends on: {', '.join(deps)}\n"
-
-    return context
-
-
-def analyze_dependencies(files_content):
-    """Analyze file dependencies based on imports and references"""
-    dependencies = {}
-    import_patterns = {
-        ".py": ["import ", "from "],
-        ".js": ["import ", "require("],
-        ".html": ["<script src=", "<link href="],
-    }
-
-    for file_path, content in files_content.items():
-        ext = os.path.splitext(file_path)[1]
-        deps = set()
-
-        if ext in import_patterns:
-            lines = content.split("\n")
-            for line in lines:
-                for pattern in import_patterns[ext]:
-                    if pattern in line:
-                        # Extract dependency name (simplified)
-                        dep = line.split(pattern)[-1].split()[0].strip("\"';")
-                        deps.add(dep)
-
-        dependencies[file_path] = deps
-
-    return dependencies
+    return {"cache_buster": CACHE_BUSTER}
+
+
+# Binary files and common non-text formats run_linter never lints
+LINT_SKIP_EXTENSIONS = frozenset({
+    # Binary files
+    ".pyc",
+    ".pyo",
+    ".so",
+    ".dll",
+    ".exe",
+    ".bin",
+    # Images
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".bmp",
+    ".ico",
+    ".webp",
+    # Documents
+    ".pdf",
+    ".doc",
+    ".docx",
+    ".xls",
+    ".xlsx",
+    ".ppt",
+    ".pptx",
+    # Archives
+    ".zip",
+    ".tar",
+    ".gz",
+    ".rar",
+    ".7z",
+    # Media
+    ".mp3",
+    ".mp4",
+    ".avi",
+    ".mov",
+    ".wav",
+    # Other binaries
+    ".db",
+    ".sqlite",
+    ".class",
+    ".o",
+})
+
+
+@lru_cache(maxsize=None)
+def _pylama_options():
+    """pylama's options, read from the working directory's config once"""
+    from pylama.config import parse_options
+
+    return parse_options([])
+
+
+def _pylama_check(file_path):
+    """Lint one file with pylama in this process, returning its messages"""
+    from pylama.main import DEFAULT_FORMAT, check_paths
+
+    errors = check_paths([file_path],
+                         options=_pylama_options(),
+                         rootdir=Path.cwd())
+    return [error.format(DEFAULT_FORMAT) for error in errors]
 
 
 def run_linter(file_path):
     """Run pylama for multi-language linting support"""
     try:
-        import subprocess
-        from pathlib import Path
-
         # Get file extension
         file_ext = Path(file_path).suffix.lower()
 
         # Skip binary files and common non-text formats
-        binary_extensions = {
-            # Binary files
-            ".pyc",
-            ".pyo",
-            ".so",
-            ".dll",
-            ".exe",
-            ".bin",
-            # Images
-            ".jpg",
-            ".jpeg",
-            ".png",
-            ".gif",
-            ".bmp",
-            ".ico",
-            ".webp",
-            # Documents
-            ".pdf",
-            ".doc",
-            ".docx",
-            ".xls",
-            ".xlsx",
-            ".ppt",
-            ".pptx",
-            # Archives
-            ".zip",
-            ".tar",
-            ".gz",
-            ".rar",
-            ".7z",
-            # Media
-            ".mp3",
-            ".mp4",
-            ".avi",
-            ".mov",
-            ".wav",
-            # Other binaries
-            ".db",
-            ".sqlite",
-            ".class",
-            ".o",
-        }
-        if file_ext in binary_extensions:
+        if file_ext in LINT_SKIP_EXTENSIONS:
             return True
 
-        # Run pylama with appropriate configuration
-        try:
-            result = subprocess.run(
-                ["pylama", file_path],
-                capture_output=True,
-                text=True,
-                timeout=30,  # Add timeout to prevent hanging
-            )
-            # Print linting output for debugging
-            if result.stdout or result.stderr:
-                print(f"\nLinting output for {file_path}:")
-                if result.stdout:
-                    print("stdout:", result.stdout)
-                if result.stderr:
-                    print("stderr:", result.stderr)
-            return result.returncode == 0
-        except subprocess.TimeoutExpired:
-            print(f"Linting timeout for {file_path}")
-            return False
-        except subprocess.CalledProcessError as e:
-            print(f"Linting process error for {file_path}: {e}")
-            return False
+        # pylama only checks .py files, so anything else always passes
+        if not file_path.endswith(".py"):
+            return True
+
+        # Reuse the result if this exact file content was already linted
+        stats = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            content_hash = hashlib.blake2b(f.read(), digest_size=16).digest()
+        cache_key = (file_path, stats.st_mtime_ns, stats.st_size,
+                     content_hash)
+        cached = _lint_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Lint in-process instead of starting a new interpreter per file;
+        # the checks are CPU-bound, so keep them off the event loop
+        problems = tpool.execute(_pylama_check, file_path)
+        # Log linting output for debugging
+        if problems and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Linting output for %s:\n%s", file_path,
+                         "\n".join(problems))
+        passed = not problems
+        if len(_lint_cache) >= LINT_CACHE_MAX_ENTRIES:
+            _lint_cache.pop(next(iter(_lint_cache)), None)
+        _lint_cache[cache_key] = passed
+        return passed
 
     except Exception as e:
         print(f"Linting error for {file_path}: {str(e)}")
         return False
 
 
+def apply_text_changes(content, changes):
+    """Apply a list of old/new changes as chained str.replace calls would"""
+    return workspace_manager.apply_replacements(
+        content, [(change["old"], change["new"]) for change in changes
+                  if "old" in change and "new" in change])
+
+
 def apply_changes(suggestions, workspace_dir):
     """Apply the suggested changes to the workspace"""
     results = []
+    # normpath drops a trailing separator that would leave basename empty
+    workspace_id = os.path.basename(os.path.normpath(workspace_dir))
 
     try:
         for operation in suggestions["operations"]:
@@ -1483,11 +2146,8 @@ def apply_changes(suggestions, workspace_dir):
                         content = f.read()
 
                     # Apply the changes
-                    new_content = content
-                    for change in operation["changes"]:
-                        if "old" in change and "new" in change:
-                            new_content = new_content.replace(change["old"],
-                                                              change["new"])
+                    new_content = apply_text_changes(content,
+                                                     operation["changes"])
                     # Store the new content in the operation
                     operation["content"] = new_content
 
@@ -1496,8 +2156,7 @@ def apply_changes(suggestions, workspace_dir):
                         f.write(new_content)
 
                     # Run appropriate linter
-                    operation["linter_status"] = workspace_manager.run_linter(
-                        file_path)
+                    operation["linter_status"] = run_linter(file_path)
 
                     results.append({
                         "status": "success",
@@ -1513,8 +2172,7 @@ def apply_changes(suggestions, workspace_dir):
                         f.write(operation["content"])
 
                     # Run appropriate linter
-                    operation["linter_status"] = workspace_manager.run_linter(
-                        file_path)
+                    operation["linter_status"] = run_linter(file_path)
 
                     results.append({
                         "status": "success",
@@ -1555,36 +2213,174 @@ def apply_changes(suggestions, workspace_dir):
                     "error": str(e)
                 })
 
-        # Notify all clients about the changes
-        workspace_id = os.path.basename(workspace_dir)
-        modified_files = [
-            result["operation"]["path"] for result in results
-            if result["status"] == "success"
-        ]
-        socketio.emit(
-            "changes_applied",
-            {
-                "workspace_id": workspace_id,
-                "modified_files": modified_files
-            },
-        )
+        # Nested changes don't touch the workspace mtime the history and
+        # the structure cache use
+        _history_cache.pop(workspace_id, None)
+        workspace_manager.clear_structure_cache(workspace_dir)
+
+        # Notify the clients that have this workspace open, if any. The
+        # fan-out runs as its own green thread so the caller doesn't wait
+        # for every socket write
+        room = workspace_room(workspace_id)
+        if has_socket_listeners(room):
+            modified_files = tuple(result["operation"]["path"]
+                                   for result in results
+                                   if result["status"] == "success")
+            socketio.start_background_task(
+                socketio.emit,
+                "changes_applied",
+                {
+                    "workspace_id": workspace_id,
+                    "modified_files": modified_files
+                },
+                to=room,
+            )
 
         return results
     except Exception as e:
         raise Exception(f"Failed to apply changes: {str(e)}")
 
 
+def estimate_tokens(text):
+    """Rough token count of about four UTF-8 bytes per token"""
+    # ASCII text is one byte per character, so skip encoding a copy
+    if text.isascii():
+        return len(text) // 4
+    return len(text.encode("utf-8")) // 4
+
+
+class TokenBudget:
+    """Track how a prompt's token budget is shared out between its parts"""
+
+    def __init__(self, total):
+        self.total = total
+        self.used = 0
+        self.allocations = {}
+
+    def allocate(self, label, tokens):
+        """Record tokens given to label and return them"""
+        self.allocations[label] = tokens
+        self.used += tokens
+        return tokens
+
+    def remaining(self):
+        return self.total - self.used
+
+    def breakdown(self):
+        return dict(self.allocations)
+
+
+def format_files_content(files_content):
+    """Render file contents as one prompt section, joined in a single pass"""
+    parts = ["Files content:\n"]
+    for path, content in files_content.items():
+        parts.append(f"\nFile: {path}\nContent:\n{content}\n")
+    return "".join(parts)
+
+
+# Characters that matter when tracking JSON nesting
+JSON_STRUCTURE_CHARS = re.compile(r'[{}"\\]')
+
+# A reply wrapped whole in a markdown code block; the group is the body
+# between the opening fence line (with any language tag) and the closing
+# fence
+JSON_CODE_FENCE = re.compile(r"\A\s*```[^\n]*\n(.*?)\s*```\s*\Z", re.S)
+
+
+class JsonObjectScanner:
+    """Locate the first complete top-level JSON object in streamed text"""
+
+    def __init__(self):
+        self.offset = 0  # Characters fed so far
+        self.depth = 0
+        self.in_string = False
+        self.escaped_pos = -1  # Position of a backslash-escaped character
+        self.start = -1
+        self.end = -1
+
+    def feed(self, chunk):
+        """Advance over chunk; start and end are set once an object closes"""
+        if self.end == -1:
+            # Jump straight between braces, quotes and backslashes
+            for match in JSON_STRUCTURE_CHARS.finditer(chunk):
+                pos = self.offset + match.start()
+                if pos == self.escaped_pos:
+                    continue
+                char = match.group()
+                if self.in_string:
+                    if char == "\\":
+                        self.escaped_pos = pos + 1
+                    elif char == '"':
+                        self.in_string = False
+                elif char == "{":
+                    if self.depth == 0:
+                        self.start = pos
+                    self.depth += 1
+                elif self.depth == 0:
+                    # Prose before the object: quotes and stray braces
+                    # don't count
+                    continue
+                elif char == '"':
+                    self.in_string = True
+                elif char == "}":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.end = pos
+                        break
+        self.offset += len(chunk)
+
+    def object_text(self, text):
+        """The located object within text, or None if none has closed"""
+        if self.end == -1:
+            return None
+        return text[self.start:self.end + 1]
+
+
+def _preprocess_json(text):
+    """Rewrite triple-quoted strings in a model's JSON as JSON strings"""
+    parts = []
+    last_pos = 0
+    pos = text.find('"""')
+
+    while pos != -1:
+        # Add the text before the triple quotes
+        parts.append(text[last_pos:pos])
+
+        # Find the closing triple quotes
+        end_pos = text.find('"""', pos + 3)
+        if end_pos == -1:
+            # If no closing quotes found, treat the rest as normal text
+            parts.append(text[pos:])
+            last_pos = len(text)
+            break
+
+        # Get the content between triple quotes and escape it
+        content = text[pos + 3:end_pos]
+        escaped_content = content.replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'"{escaped_content}"')
+
+        last_pos = end_pos + 3
+        pos = text.find('"""', last_pos)
+
+    # Add any remaining text
+    if last_pos < len(text):
+        parts.append(text[last_pos:])
+    return "".join(parts)
+
+
 def get_code_suggestion(prompt,
                         files_content=None,
                         model_id=None,
-                        workspace_context=None):
+                        workspace_context=None,
+                        socket_sid=None):
     """Get code suggestions from the selected AI model"""
-    if model_id not in model_clients:
+    model_config = get_model_config(model_id)
+    if model_config is None:
         raise Exception(
             f"Model {model_id} is not configured. Please check your API keys.")
 
-    client = model_clients[model_id]
-    model_config = AVAILABLE_MODELS[model_id]
+    client = model_config.client
+    temperature = code_suggestion_temperature(model_config)
 
     try:
         print("\n=== Step 1: Preparing AI Request ===")
@@ -1592,7 +2388,7 @@ def get_code_suggestion(prompt,
         print(f"Prompt length: {len(prompt)} characters")
 
         # Create the messages array for the chat
-        if model_id in ["o1", "o1-mini"]:
+        if model_config.system_in_user:
             messages = []
             # Combine all system messages into a single user message
             system_content = [system_prompt]
@@ -1600,10 +2396,7 @@ def get_code_suggestion(prompt,
                 system_content.append(
                     f"Workspace context:\n{workspace_context}")
             if files_content:
-                files_content_str = "Files content:\n"
-                for path, content in files_content.items():
-                    files_content_str += f"\nFile: {path}\nContent:\n{content}\n"
-                system_content.append(files_content_str)
+                system_content.append(format_files_content(files_content))
             system_content.append(
                 f'{prompt}\n\nIMPORTANT: Your response MUST be a valid JSON object following this exact structure:\n{{\n    "explanation": "Brief explanation of what you will do",\n    "operations": [\n        {{\n            "type": "edit_file",\n            "path": "relative/path",\n            "changes": [\n                {{\n                    "old": "text to replace",\n                    "new": "replacement text"\n                }}\n            ]\n        }}\n    ]\n}}'
             )
@@ -1626,12 +2419,9 @@ def get_code_suggestion(prompt,
 
             # Add files content if provided
             if files_content:
-                files_content_str = "Files content:\n"
-                for path, content in files_content.items():
-                    files_content_str += f"\nFile: {path}\nContent:\n{content}\n"
                 messages.append({
                     "role": "system",
-                    "content": files_content_str
+                    "content": format_files_content(files_content)
                 })
 
             # Add the user's prompt with explicit JSON instruction
@@ -1642,70 +2432,107 @@ def get_code_suggestion(prompt,
                 f'{prompt}\n\nIMPORTANT: Your response MUST be a valid JSON object following this exact structure:\n{{\n    "explanation": "Brief explanation of what you will do",\n    "operations": [\n        {{\n            "type": "edit_file",\n            "path": "relative/path",\n            "changes": [\n                {{\n                    "old": "text to replace",\n                    "new": "replacement text"\n                }}\n            ]\n        }}\n    ]\n}}',
             })
 
-        # Estimate total tokens
-        total_tokens = sum(
-            len(msg["content"].encode("utf-8")) // 4 for msg in messages)
-        max_tokens = model_config.get("max_tokens", 100000)
+        # Estimate each message once; the total and the truncation below
+        # both reuse these counts
+        message_tokens = [estimate_tokens(msg["content"]) for msg in messages]
+        total_tokens = sum(message_tokens)
+        max_tokens = model_config.max_tokens
 
         # If total tokens exceed model's limit, truncate the system messages
         if total_tokens > max_tokens:
             # Keep prompt intact, truncate context
-            available_tokens = (max_tokens -
-                                (len(prompt.encode("utf-8")) // 4) - 1000
-                                )  # Leave buffer
-            if available_tokens > 0:
-                # Truncate each system message proportionally
-                for i in range(len(messages) -
-                               1):  # Skip the last message (user prompt)
-                    if messages[i]["role"] == "system":
+            available_tokens = (max_tokens - estimate_tokens(prompt) -
+                                PROMPT_TOKEN_RESERVE)
+            # Smallest system messages first: each keeps everything while it
+            # fits an even share of what's left, so only the largest ones are
+            # truncated
+            system_indexes = sorted(
+                (i for i in range(len(messages) - 1)
+                 if messages[i]["role"] == "system"),
+                key=message_tokens.__getitem__,
+            )
+            if available_tokens <= 0:
+                raise Exception("Message too long even after truncation")
+            if not system_indexes:
+                # system_in_user models send everything as one user message,
+                # so there is no separate context to share the budget out to
+                print("No system messages to truncate; sending as is")
+            else:
+                budget = TokenBudget(available_tokens)
+                for n, i in enumerate(system_indexes):
+                    share = budget.remaining() // (len(system_indexes) - n)
+                    if message_tokens[i] <= share:
+                        budget.allocate(i, message_tokens[i])
+                    else:
                         messages[i]["content"] = (
                             workspace_manager._truncate_content_for_context(
-                                messages[i]["content"],
-                                max_tokens=available_tokens //
-                                (len(messages) - 1),
-                            ))
+                                messages[i]["content"], max_tokens=share))
+                        budget.allocate(i, share)
                 print(
-                    f"Truncated context to fit within {available_tokens} tokens"
+                    f"Truncated context to fit within {available_tokens} tokens: {budget.breakdown()}"
                 )
-            else:
-                raise Exception("Message too long even after truncation")
 
         print("\n=== Step 2: Sending Request to AI Model ===")
         start_time = time.time()
 
-        if model_id == "claude":
-            # Use Anthropic's client interface
-            full_context = "\n\n".join(msg["content"] for msg in messages)
-            response = client.messages.create(
-                model=model_config["models"]["code"],
-                messages=[{
-                    "role":
-                    "user",
-                    "content":
-                    f"{full_context}\n\nPlease provide your response in valid JSON format following the structure specified above.",
-                }],
-                temperature=0.1,
-                max_tokens=4096,
-            )
-            full_text = response.content[0].text
-            print(f"\nResponse received in {time.time() - start_time:.1f}s")
-            print(f"Response length: {len(full_text)} characters")
-        elif model_id == "gemini":
+        # Track the reply's JSON object as it streams in, so it is
+        # located by the time the last chunk arrives
+        json_scanner = JsonObjectScanner()
+        # Forward text to the client as it is generated
+        chunk_batcher = ChunkBatcher(
+            lambda text, chars: socketio.emit("llm_chunk", {
+                "text": text,
+                "chars": chars
+            }, to=socket_sid),
+            to=socket_sid)
+
+        def forward_chunk(content, total_chars):
+            json_scanner.feed(content)
+            chunk_batcher.add(content)
+
+        if model_config.kind is ModelKind.ANTHROPIC:
+            # Use Anthropic's client interface. System content goes in the
+            # system parameter so the static prefix can be served from the
+            # prompt cache; the last block is also marked so repeated
+            # requests over the same files reuse the cached context.
+            system_blocks = [SYSTEM_PROMPT_BLOCK]
+            for msg in messages[1:-1]:
+                system_blocks.append({"type": "text", "text": msg["content"]})
+            if len(system_blocks) > 1:
+                system_blocks[-1]["cache_control"] = {"type": "ephemeral"}
+            with client.messages.stream(
+                    model=model_config.code_model,
+                    system=system_blocks,
+                    messages=[{
+                        "role":
+                        "user",
+                        "content":
+                        f"{messages[-1]['content']}\n\nPlease provide your response in valid JSON format following the structure specified above.",
+                    }],
+                    temperature=temperature,
+                    max_tokens=4096,
+            ) as stream:
+                print("Request sent, waiting for response...")
+                socketio.emit("status", {
+                    "message": "Receiving AI response...",
+                    "step": 2
+                }, to=socket_sid)
+                full_text = _consume_stream(stream.text_stream, start_time,
+                                            "Receiving response...",
+                                            forward_chunk, socket_sid)
+        elif model_config.kind is ModelKind.GENAI:
             # Use the Google AI client
             try:
-                model = client.GenerativeModel("gemini-2.0-flash-exp")
+                model = client.GenerativeModel(model_config.code_model)
                 chat = model.start_chat(history=[])
 
-                # Combine all messages into a single context
-                full_context = "\n\n".join(msg["content"] for msg in messages)
+                # Combine all messages into a single context; the parts are
+                # kept so a retry only replaces the messages it truncates
+                context_parts = [msg["content"] for msg in messages]
+                full_context = "\n\n".join(context_parts)
 
-                response = chat.send_message(
-                    full_context,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.1,
-                        candidate_count=1,
-                        max_output_tokens=8192),
-                )
+                response = _gemini_send(client, chat, full_context, 8192,
+                                        temperature)
 
                 if not response or not response.text:
                     raise Exception("Empty response from Gemini")
@@ -1721,22 +2548,16 @@ def get_code_suggestion(prompt,
                     # Try again with more aggressive truncation
                     for i in range(len(messages) - 1):
                         if messages[i]["role"] == "system":
-                            messages[i]["content"] = (
+                            messages[i]["content"] = context_parts[i] = (
                                 workspace_manager.
                                 _truncate_content_for_context(
                                     messages[i]["content"],
                                     max_tokens=10000,  # Even more conservative
                                 ))
                     # Combine truncated messages
-                    full_context = "\n\n".join(msg["content"]
-                                               for msg in messages)
-                    response = chat.send_message(
-                        full_context,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.1,
-                            candidate_count=1,
-                            max_output_tokens=4096),
-                    )
+                    full_context = "\n\n".join(context_parts)
+                    response = _gemini_send(client, chat, full_context,
+                                            4096, temperature)
                     if not response or not response.text:
                         raise Exception(
                             "Empty response from Gemini after truncation")
@@ -1746,9 +2567,9 @@ def get_code_suggestion(prompt,
         else:
             # Use streaming for other OpenAI-compatible models
             response = client.chat.completions.create(
-                model=model_config["models"]["code"],
+                model=model_config.code_model,
                 messages=messages,
-                temperature=1 if model_id in ["o1", "o1-mini"] else 0.1,
+                temperature=temperature,
                 stream=True,
             )
 
@@ -1756,125 +2577,56 @@ def get_code_suggestion(prompt,
             socketio.emit("status", {
                 "message": "Receiving AI response...",
                 "step": 2
-            })
+            }, to=socket_sid)
 
-            # Process the streamed response
-            full_text = ""
-            chunk_count = 0
-            last_update = time.time()
-            update_interval = 0.5
-
-            for chunk in response:
-                if (chunk and hasattr(chunk.choices[0], "delta")
-                        and hasattr(chunk.choices[0].delta, "content")):
-                    content = chunk.choices[0].delta.content
-                    if content is not None:
-                        full_text += content
-                        chunk_count += 1
-
-                    current_time = time.time()
-                    if current_time - last_update >= update_interval:
-                        elapsed = current_time - start_time
-                        tokens_per_second = chunk_count / elapsed if elapsed > 0 else 0
-                        print(
-                            f"\rReceived {chunk_count} chunks ({len(full_text)} chars) in {elapsed:.1f}s ({tokens_per_second:.1f} chunks/s)",
-                            end="",
-                        )
-                        socketio.emit(
-                            "status",
-                            {
-                                "message":
-                                f"Receiving response... ({len(full_text)} characters)",
-                                "step": 2,
-                                "progress": {
-                                    "chunks": chunk_count,
-                                    "chars": len(full_text),
-                                    "elapsed": elapsed,
-                                    "rate": tokens_per_second,
-                                },
-                            },
-                        )
-                        last_update = current_time
-
-            print(f"\nResponse complete in {time.time() - start_time:.1f}s")
-            print(
-                f"Total response size: {len(full_text)} characters in {chunk_count} chunks"
-            )
+            full_text = _consume_stream(_openai_stream_text(response),
+                                        start_time, "Receiving response...",
+                                        forward_chunk, socket_sid)
 
-        # Clean up the response text and try to extract JSON
-        cleaned_text = full_text.strip()
-
-        # Try to extract JSON from the response if it's wrapped in markdown
-        # code blocks
-        if cleaned_text.startswith("```") and cleaned_text.endswith("```"):
-            # Remove the code block markers and any language identifier
-            cleaned_text = (cleaned_text.split("\n", 1)[1]
-                            if "\n" in cleaned_text else cleaned_text)
-            cleaned_text = (cleaned_text.rsplit("\n", 1)[0]
-                            if "\n" in cleaned_text else cleaned_text)
-            cleaned_text = cleaned_text.strip("`").strip()
-            if cleaned_text.startswith("json"):
-                cleaned_text = cleaned_text[4:].strip()
-
-        # Try to find JSON content within the response
-        json_start = cleaned_text.find("{")
-        json_end = cleaned_text.rfind("}")
+        if model_config.kind is ModelKind.GENAI:
+            json_scanner.feed(full_text)
+        else:
+            chunk_batcher.flush()
 
-        if json_start != -1 and json_end != -1 and json_start < json_end:
+        # Parse the object found while streaming; the slower clean-up
+        # below is only needed when that isn't valid JSON on its own
+        json_text = json_scanner.object_text(full_text)
+        if json_text is not None:
             try:
-                # Extract the JSON part
-                json_text = cleaned_text[json_start:json_end + 1]
-
-                # Preprocess the JSON text to handle triple quotes
-                def preprocess_json(text):
-                    # Split the text into parts by finding all occurrences of
-                    # triple quotes
-                    parts = []
-                    last_pos = 0
-                    pos = text.find('"""')
-
-                    while pos != -1:
-                        # Add the text before the triple quotes
-                        parts.append(text[last_pos:pos])
-
-                        # Find the closing triple quotes
-                        end_pos = text.find('"""', pos + 3)
-                        if end_pos == -1:
-                            # If no closing quotes found, treat the rest as
-                            # normal text
-                            parts.append(text[pos:])
-                            break
-
-                        # Get the content between triple quotes and escape it
-                        content = text[pos + 3:end_pos]
-                        escaped_content = content.replace('"', '\\"').replace(
-                            "\n", "\\n")
-                        parts.append(f'"{escaped_content}"')
-
-                        last_pos = end_pos + 3
-                        pos = text.find('"""', last_pos)
-
-                    # Add any remaining text
-                    if last_pos < len(text):
-                        parts.append(text[last_pos:])
-
-                    # Join parts and normalize quotes
-                    result = "".join(parts)
-                    # Replace curly quotes with straight quotes
-                    result = result.replace('"', '"').replace('"', '"')
+                result = orjson.loads(json_text)
+                if isinstance(result, dict) and "operations" in result:
                     return result
+            except orjson.JSONDecodeError:
+                pass
 
-                # Preprocess the JSON text and parse it
-                processed_json = preprocess_json(json_text)
-                result = json.loads(processed_json)
+        # Unwrap the response if it's wrapped in a markdown code block
+        fenced = JSON_CODE_FENCE.match(full_text)
+        cleaned_text = (fenced.group(1).strip()
+                        if fenced else full_text.strip())
+
+        # Try to find JSON content within the response
+        json_start = cleaned_text.find("{")
+        if json_start != -1:
+            # Rewrite triple-quoted strings first, then take the object
+            # that the first brace opens rather than running to the last
+            # brace in the reply
+            processed_json = _preprocess_json(cleaned_text[json_start:])
+            object_scanner = JsonObjectScanner()
+            object_scanner.feed(processed_json)
+            json_text = object_scanner.object_text(processed_json)
+            if json_text is None:
+                # Unbalanced braces; let the parser report where
+                json_text = processed_json[:processed_json.rfind("}") + 1]
+            try:
+                result = orjson.loads(json_text)
 
                 if isinstance(result, dict) and "operations" in result:
                     return result
 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 print(f"JSON decode error: {str(e)}")
-                print(f"JSON text: {json_text}")
-                print(f"Processed JSON: {processed_json}")
+                logger.debug("JSON text: %s\nProcessed JSON: %s", json_text,
+                             processed_json)
                 raise ValueError(
                     f"Invalid JSON format: {str(e)}. Please try again with a clearer prompt."
                 )
@@ -1886,7 +2638,10 @@ def get_code_suggestion(prompt,
         )
 
     except Exception as e:
-        socketio.emit("status", {"message": f"Error: {str(e)}", "step": -1})
+        socketio.emit("status", {
+            "message": f"Error: {str(e)}",
+            "step": -1
+        }, to=socket_sid)
         print(f"\nError getting code suggestion: {str(e)}")
         raise
 
@@ -1909,18 +2664,36 @@ def import_folder():
             return jsonify(
                 {"error": "A workspace with this name already exists"}), 400
 
-        # Create link based on platform
-        if os.name == "nt":  # Windows
-            import subprocess
+        # Mark the folder as an imported workspace before linking it, so
+        # the workspace never appears without its flag file
+        flag_path = os.path.join(source_path, ".imported")
+        payload = orjson.dumps({
+            "source_path": source_path,
+            "imported_at": datetime.now().isoformat()
+        })
+        fd = os.open(flag_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
 
+        # Create link based on platform
+        root_mtime = workspace_root_mtime()
+        try:
+            os.symlink(source_path, workspace_dir, target_is_directory=True)
+        except OSError:
+            if os.name != "nt":
+                os.remove(flag_path)
+                raise
+            # Directory symlinks need Developer Mode or admin rights on
+            # Windows; fall back to a junction, which needs neither
             try:
-                # Use mklink /J to create a directory junction (no admin
-                # required)
                 subprocess.run(
                     ["cmd", "/c", "mklink", "/J", workspace_dir, source_path],
                     check=True,
                 )
             except subprocess.CalledProcessError as e:
+                os.remove(flag_path)
                 return (
                     jsonify({
                         "error":
@@ -1928,18 +2701,7 @@ def import_folder():
                     }),
                     500,
                 )
-        else:  # Unix-like systems
-            os.symlink(source_path, workspace_dir, target_is_directory=True)
-
-        # Create a .imported flag file to mark this as an imported workspace
-        with open(os.path.join(workspace_dir, ".imported"), "w") as f:
-            json.dump(
-                {
-                    "source_path": source_path,
-                    "imported_at": datetime.now().isoformat()
-                },
-                f,
-            )
+        update_workspace_index(root_mtime, added=workspace_id)
 
         # Get the workspace structure
         structure = get_workspace_structure(workspace_dir)
@@ -1956,6 +2718,58 @@ def import_folder():
         return jsonify({"error": str(e)}), 500
 
 
+@lru_cache(maxsize=512)
+def _scan_available_folders(path, mtime_ns, period):
+    """List the folders in path with their sizes, importable ones first.
+
+    mtime_ns and period only key the cache: a listing is reused until the
+    folder changes or the period rolls over.
+    """
+    available_items = []
+    # DirEntry answers is_dir() from the directory read itself, leaving
+    # one stat per folder for its modified time
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if not entry.is_dir():
+                    continue
+                item = entry.name
+                item_info = {
+                    "name": item,
+                    "path": entry.path,
+                    "type": "directory",
+                    "modified": entry.stat().st_mtime,
+                    "is_navigable": True,
+                }
+                # Only calculate size and files count if this is a
+                # potential import target
+                if not item.startswith("."):
+                    try:
+                        size, files = folder_stats(entry.path)
+                        item_info.update({
+                            "size": size,
+                            "files": files,
+                            "is_importable": True,
+                        })
+                    except BaseException:
+                        item_info.update({
+                            "size": 0,
+                            "files": 0,
+                            "is_importable": False
+                        })
+                available_items.append(item_info)
+            except Exception as e:
+                print(f"Error processing folder {entry.name}: {e}")
+                continue
+    return sorted(
+        available_items,
+        key=lambda x: (
+            not x.get("is_importable", False),
+            x["name"].lower(),
+        ),
+    )
+
+
 @app.route("/available-folders", methods=["GET"])
 def list_available_folders():
     """List folders available for import from user's home directory"""
@@ -1964,76 +2778,33 @@ def list_available_folders():
         home_dir = os.path.expanduser("~")
         path = request.args.get("path", home_dir)
 
-        # Ensure the path is within home directory for security
-        if not os.path.abspath(path).startswith(os.path.abspath(home_dir)):
+        # Ensure the path is within home directory for security; compared
+        # by path components so "/home/user2" isn't inside "/home/user"
+        if not Path(os.path.abspath(path)).is_relative_to(
+                os.path.abspath(home_dir)):
             return jsonify(
                 {"error": "Access denied: Path outside home directory"}), 403
 
         # Get parent path for navigation
         parent_path = os.path.dirname(path) if path != home_dir else None
 
-        available_items = []
         try:
-            for item in os.listdir(path):
-                full_path = os.path.join(path, item)
-                if os.path.isdir(full_path):
-                    try:
-                        stats = os.stat(full_path)
-                        item_info = {
-                            "name": item,
-                            "path": full_path,
-                            "type": "directory",
-                            "modified": stats.st_mtime,
-                            "is_navigable": True,
-                        }
-                        # Only calculate size and files count if this is a
-                        # potential import target
-                        if not item.startswith("."):
-                            try:
-                                item_info.update({
-                                    "size":
-                                    sum(
-                                        os.path.getsize(
-                                            os.path.join(dirpath, filename))
-                                            for dirpath, dirnames, filenames in
-                                            os.walk(full_path)
-                                            for filename in filenames),
-                                    "files":
-                                    sum(
-                                        len(files)
-                                        for _, _, files in os.walk(full_path)),
-                                    "is_importable":
-                                    True,
-                                })
-                            except BaseException:
-                                item_info.update({
-                                    "size": 0,
-                                    "files": 0,
-                                    "is_importable": False
-                                })
-                        available_items.append(item_info)
-                    except Exception as e:
-                        print(f"Error processing folder {item}: {e}")
-                        continue
+            # Entries are added or removed when the folder's mtime changes;
+            # the time period bounds how stale nested sizes can get
+            items = _scan_available_folders(
+                path,
+                os.stat(path).st_mtime_ns,
+                int(time.time() // FOLDER_LISTING_TTL),
+            )
         except PermissionError:
             return jsonify(
                 {"error": "Permission denied accessing this directory"}), 403
 
         return jsonify({
-            "status":
-            "success",
-            "current_path":
-            path,
-            "parent_path":
-            parent_path,
-            "items":
-            sorted(
-                available_items,
-                key=lambda x: (
-                    not x.get("is_importable", False),
-                    x["name"].lower(),
-                ),
-            ),
+            "status": "success",
+            "current_path": path,
+            "parent_path": parent_path,
+            "items": items,
         })
 
     except Exception as e:
@@ -2058,26 +2829,28 @@ def rename_file():
                 400,
             )
 
-        # Ensure paths are within workspace
-        old_full_path = os.path.abspath(os.path.join(workspace_dir, old_path))
-        new_full_path = os.path.abspath(os.path.join(workspace_dir, new_path))
+        # Ensure paths are strictly inside the workspace
+        workspace_abs = os.path.abspath(workspace_dir)
+        old_full_path = os.path.abspath(os.path.join(workspace_abs, old_path))
+        new_full_path = os.path.abspath(os.path.join(workspace_abs, new_path))
 
-        if not all(
-                p.startswith(os.path.abspath(workspace_dir))
-                for p in [old_full_path, new_full_path]):
+        if (workspace_abs in (old_full_path, new_full_path)
+                or not is_within_workspace(old_full_path, workspace_dir)
+                or not is_within_workspace(new_full_path, workspace_dir)):
             return jsonify({
                 "status": "error",
                 "message": "Invalid file path"
             }), 400
 
-        # Check if source exists and target doesn't
-        if not os.path.exists(old_full_path):
+        # Check if source exists and target doesn't; a symlink counts as
+        # the file itself, dangling or not
+        if not os.path.lexists(old_full_path):
             return jsonify({
                 "status": "error",
                 "message": "Source file not found"
             }), 404
 
-        if os.path.exists(new_full_path):
+        if os.path.lexists(new_full_path):
             return (
                 jsonify({
                     "status": "error",
@@ -2119,32 +2892,29 @@ def get_operation_diff(operation, workspace_dir):
 
         # For edit operations
         elif operation["type"] == "edit_file":
-            new_content = current_content
-            for change in operation.get("changes", []):
-                if "old" in change and "new" in change:
-                    new_content = new_content.replace(change["old"],
-                                                              change["new"])
+            new_content = apply_text_changes(current_content,
+                                             operation.get("changes", []))
             # Store the new content in the operation
             operation["content"] = new_content
 
-        # Generate unified diff
-        from difflib import unified_diff
-
-        diff_lines = list(
-            unified_diff(
-                current_content.splitlines(keepends=True),
-                new_content.splitlines(keepends=True),
-                fromfile=f"a/{operation['path']}",
-                tofile=f"b/{operation['path']}",
-            ))
+        # Generate unified diff, unless nothing changed: then there is no
+        # need to split either side into lines or run the matcher at all
+        diff = ""
+        if new_content != current_content:
+            diff = "".join(
+                workspace_manager.unified_diff(
+                    current_content.splitlines(keepends=True),
+                    new_content.splitlines(keepends=True),
+                    fromfile=f"a/{operation['path']}",
+                    tofile=f"b/{operation['path']}",
+                ))
 
         return {
             "old_content":
             current_content,
             "new_content":
             new_content,
-            "diff": ("".join(diff_lines) if diff_lines else
-                     f"No changes detected in {operation['path']}"),
+            "diff": diff or f"No changes detected in {operation['path']}",
         }
     except Exception as e:
         print(f"Error generating diff for {operation['path']}: {str(e)}")
@@ -2156,5 +2926,9 @@ def get_operation_diff(operation, workspace_dir):
 
 
 if __name__ == "__main__":
-    # Run with eventlet server
-    socketio.run(app, debug=False, host="0.0.0.0", port=5000)
+    # Finish removing workspaces deleted before the last shutdown
+    if os.path.isdir(TRASH_DIR):
+        socketio.start_background_task(empty_trash)
+
+    # Run with eventlet server; see the README for running under gunicorn
+    socketio.run(app, debug=DEBUG, host="0.0.0.0", port=5000)
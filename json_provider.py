@@ -0,0 +1,56 @@
+"""Flask JSON provider backed by orjson."""
+
+# pylama:ignore=E501
+from typing import Any
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serialize responses and parse request bodies with orjson"""
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    def _dumps_bytes(self, obj: Any, **dump_args: Any) -> bytes:
+        """Encode with orjson, falling back to the stdlib for unsupported values.
+
+        dump_args are the json.dumps layout arguments the default provider
+        would use: indent=2, or compact separators.
+        """
+        option = self.option
+        # Match the default provider's key order and pretty-printing
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if dump_args.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            # e.g. integers wider than 64 bits
+            return super().dumps(obj, **dump_args).encode("utf-8")
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Extra json.dumps arguments can't be honoured by orjson
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s: "str | bytes", **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        # Hand orjson's bytes straight to the response, skipping the
+        # str round trip the default provider makes. Like the default
+        # provider, indent unless compact output is asked for, which it is
+        # by default outside debug mode, and end with a newline
+        obj = self._prepare_response_obj(args, kwargs)
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            dump_args = {"indent": 2}
+        else:
+            dump_args = {"separators": (",", ":")}
+        return self._app.response_class(
+            self._dumps_bytes(obj, **dump_args) + b"\n",
+            mimetype=self.mimetype)
@@ -0,0 +1,187 @@
+"""Prompt cache module for reusing AI suggestions on repeated prompts."""
+
+# pylama:ignore=E501
+import copy
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
+
+
+class PromptCache:
+    """LRU cache of model suggestions keyed by prompt, workspace state and model."""
+
+    def __init__(self,
+                 max_entries: int = 256,
+                 db_path: Optional[str] = None,
+                 max_disk_entries: int = 4096):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Keys whose suggestions are being generated, set once they're done
+        self._pending: Dict[str, threading.Event] = {}
+        # Optional SQLite copy of the cache so entries survive a restart,
+        # and the number of rows it holds
+        self._db = None
+        self._disk_entries = 0
+        if db_path:
+            try:
+                self._db = self._open_db(db_path)
+                self._disk_entries = self._db.execute(
+                    "SELECT COUNT(*) FROM suggestions").fetchone()[0]
+            except sqlite3.Error as e:
+                self._db = None
+                print(f"Prompt cache persistence disabled: {e}")
+
+    @staticmethod
+    def _open_db(db_path: str) -> sqlite3.Connection:
+        """Open the on-disk cache, creating its table on first use"""
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Access is serialized by self._lock
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute("CREATE TABLE IF NOT EXISTS suggestions ("
+                   "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                   "used REAL NOT NULL)")
+        # Lets trimming find the least recently used rows without a sort
+        db.execute("CREATE INDEX IF NOT EXISTS suggestions_used "
+                   "ON suggestions (used)")
+        db.commit()
+        return db
+
+    def make_key(self, prompt: str, files_content: Optional[Dict[str, str]],
+                 model_id: str) -> str:
+        """Build a cache key that only matches when the workspace content is identical"""
+        digest = hashlib.sha256()
+        digest.update(model_id.encode("utf-8"))
+        digest.update(b"\0")
+        # Only surrounding whitespace is ignored: case and inner spacing can
+        # change what the prompt asks for
+        digest.update(prompt.strip().encode("utf-8"))
+        for path in sorted(files_content or {}):
+            digest.update(b"\0")
+            digest.update(path.encode("utf-8"))
+            digest.update(b"\0")
+            digest.update(files_content[path].encode("utf-8", "replace"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached suggestions, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                entry = self._load(key)
+            if entry is None:
+                return None
+        # Callers mutate the operations in place, so never hand out the original
+        return copy.deepcopy(entry)
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Read an entry from disk into memory; call with the lock held"""
+        try:
+            row = self._db.execute(
+                "SELECT value FROM suggestions WHERE key = ?",
+                (key, )).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE suggestions SET used = ? WHERE key = ?",
+                             (time.time(), key))
+            self._db.commit()
+            entry = orjson.loads(row[0])
+        except (sqlite3.Error, orjson.JSONDecodeError) as e:
+            print(f"Error reading prompt cache: {e}")
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        """Add an entry to memory; call with the lock held"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, suggestions: Dict[str, Any]) -> None:
+        """Store suggestions, evicting the least recently used entries"""
+        entry = copy.deepcopy(suggestions)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is None:
+                return
+            try:
+                exists = self._db.execute(
+                    "SELECT 1 FROM suggestions WHERE key = ?",
+                    (key, )).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO suggestions VALUES (?, ?, ?)",
+                    (key, orjson.dumps(entry), time.time()))
+                if exists is None:
+                    self._disk_entries += 1
+                # Keep only the most recently used entries on disk too
+                excess = self._disk_entries - self.max_disk_entries
+                if excess > 0:
+                    self._db.execute(
+                        "DELETE FROM suggestions WHERE key IN (SELECT key "
+                        "FROM suggestions ORDER BY used LIMIT ?)", (excess, ))
+                    self._disk_entries -= excess
+                self._db.commit()
+            except (sqlite3.Error, TypeError) as e:
+                print(f"Error writing prompt cache: {e}")
+
+    def get_or_generate(
+        self,
+        key: str,
+        generate: Callable[[], Optional[Dict[str, Any]]],
+        refresh: bool = False,
+    ) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Return (suggestions, cached), calling generate at most once per key.
+
+        A request whose key is already being generated waits for that result
+        instead of asking the model again. Results with operations are cached.
+        With refresh, a cached entry is ignored and replaced by a new result.
+        """
+        while True:
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Wait for the identical request in progress and share its result
+            pending.wait()
+            suggestions = self.get(key)
+            if suggestions is not None:
+                return suggestions, True
+            # That request failed, so the first waiter here tries again
+
+        try:
+            if not refresh:
+                suggestions = self.get(key)
+                if suggestions is not None:
+                    return suggestions, True
+            suggestions = generate()
+            if suggestions and "operations" in suggestions:
+                self.put(key, suggestions)
+            return suggestions, False
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM suggestions")
+                    self._db.commit()
+                    self._disk_entries = 0
+                except sqlite3.Error as e:
+                    print(f"Error clearing prompt cache: {e}")
@@ -7,6 +7,10 @@ let expandedDirs = new Map(); // Track expanded directories and their pagination
 let term = null;
 let fitAddon = null;
 let isTerminalExpanded = false;
+let streamedText = ''; // Tail of the model response being streamed
+const STREAM_PREVIEW_CHARS = 120;
+let chatStreamMessage = null; // Assistant message the chat reply streams into
+let chatStreamHtml = '';
 
 // Initialize Application
 document.addEventListener('DOMContentLoaded', () => {
@@ -163,10 +167,26 @@ function initializeWebSocket() {
         updateProgress(data.message, data.tokens);
     });
     
+    // Model output as it is generated
+    socket.on('llm_chunk', (data) => {
+        updateStreamPreview(data.text, data.chars);
+    });
+    
+    // Chat reply HTML as it is generated
+    socket.on('chat_chunk', (data) => {
+        appendChatStream(data.html);
+    });
+    
+    socket.on('chat_done', () => {
+        chatStreamMessage = null;
+    });
+    
     // Connection status
     socket.on('connect', () => {
         console.log('Connected to server');
         updateConnectionStatus(true);
+        // Rooms don't survive a reconnect
+        joinWorkspaceRoom(currentWorkspace);
     });
     
     socket.on('disconnect', () => {
@@ -180,6 +200,15 @@ function initializeWebSocket() {
     });
 }
 
+// Receive the events for the open workspace; accepts its ID or directory
+function joinWorkspaceRoom(workspace) {
+    if (socket) {
+        socket.emit('join_workspace', {
+            workspace_id: workspace ? workspace.split(/[\\/]/).pop() : null
+        });
+    }
+}
+
 // UI Update Functions
 function updateStatus(message, step) {
     const statusElement = document.getElementById('statusMessage') || createStatusElement();
@@ -230,6 +259,29 @@ function updateProgress(message, tokens) {
     }, 10000);
 }
 
+function updateStreamPreview(text, chars) {
+    // The first chunk of a response starts a fresh preview
+    if (chars === text.length) {
+        streamedText = '';
+    }
+    streamedText = (streamedText + text).slice(-STREAM_PREVIEW_CHARS);
+    updateProgress(`Receiving response (${chars} chars): ${streamedText}`, chars);
+}
+
+function startChatStream(messageDiv) {
+    chatStreamMessage = messageDiv;
+    chatStreamHtml = '';
+}
+
+function appendChatStream(html) {
+    if (!chatStreamMessage) return;
+    // Re-render the whole reply so tags split across chunks still parse
+    chatStreamHtml += html;
+    chatStreamMessage.innerHTML = chatStreamHtml;
+    const chatHistory = document.getElementById('chatHistory');
+    chatHistory.scrollTop = chatHistory.scrollHeight;
+}
+
 function updateConnectionStatus(connected) {
     const statusIndicator = document.getElementById('connectionStatus') || createConnectionIndicator();
     statusIndicator.className = `connection-status ${connected ? 'connected' : 'disconnected'}`;
@@ -362,6 +414,7 @@ async function createWorkspace() {
         if (data.status === 'success') {
             currentWorkspace = data.workspace_dir;
             updateWorkspaceInfo(data.workspace_id);
+            joinWorkspaceRoom(data.workspace_id);
             updateWorkspaceTree(data.structure);
             await loadWorkspaceHistory();
         } else {
@@ -523,6 +576,7 @@ async function renameWorkspace(workspaceId, newName) {
             if (currentWorkspace && currentWorkspace.endsWith(workspaceId)) {
                 currentWorkspace = data.new_path;
                 updateWorkspaceInfo(newName);
+                joinWorkspaceRoom(newName);
             }
             
             // Reload the workspace history
@@ -566,6 +620,7 @@ async function selectWorkspace(path) {
 
     currentWorkspace = path;
     console.log('Current workspace set to:', currentWorkspace);
+    joinWorkspaceRoom(path);
     
     try {
         console.log('Fetching workspace structure for:', path);
@@ -1153,7 +1208,8 @@ async function processPrompt() {
                 workspace_dir: currentWorkspace,
                 model_id: document.getElementById('modelSelect').value,
                 attachments: attachments,
-                context_path: contextPath  // Add the context path if available
+                context_path: contextPath,  // Add the context path if available
+                socket_id: socket ? socket.id : null  // Stream the reply to this page only
             })
         });
 
@@ -1207,6 +1263,7 @@ async function sendChatMessage() {
 
     // Show loading indicator
     const loadingMessage = appendChatMessage('<i class="fas fa-spinner fa-spin"></i> Thinking...', 'assistant', true);
+    startChatStream(loadingMessage);
     
     try {
         const response = await fetch('/chat', {
@@ -1218,7 +1275,8 @@ async function sendChatMessage() {
                 prompt: message,
                 workspace_dir: currentWorkspace,
                 model_id: document.getElementById('modelSelect').value,
-                attachments: attachments
+                attachments: attachments,
+                socket_id: socket ? socket.id : null
             })
         });
 
@@ -1646,7 +1704,8 @@ async function applyChanges(operations) {
     hideModal();
 
     try {
-        const response = await fetch('/apply_changes', {
+        // Ask for the updated tree to refresh the sidebar
+        const response = await fetch('/apply_changes?structure=1', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -2240,6 +2299,7 @@ async function getRecommendations(path, type) {
     
     // Show loading indicator
     const loadingMessage = appendChatMessage('<i class="fas fa-spinner fa-spin"></i> Analyzing...', 'assistant', true);
+    startChatStream(loadingMessage);
     
     try {
         const response = await fetch('/chat', {
@@ -2251,7 +2311,8 @@ async function getRecommendations(path, type) {
                 prompt: prompt,
                 workspace_dir: currentWorkspace,
                 model_id: document.getElementById('modelSelect').value,
-                context_path: path
+                context_path: path,
+                socket_id: socket ? socket.id : null
             })
         });
 
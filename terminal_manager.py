@@ -9,7 +9,8 @@ import signal
 import struct
 import threading
 import time
-from threading import Thread
+
+from eventlet import tpool
 
 # Import platform-specific modules
 if platform.system() != "Windows":
@@ -67,11 +68,10 @@ class TerminalManager:
             time.sleep(0.1)
             self.pty.write(f"mode CON: COLS={cols} LINES={rows}\r\n")
 
-            # Start reading thread
+            # Start reading task on the socket server's event loop
             self.running = True
-            self.read_thread = Thread(target=self._read_windows_output)
-            self.read_thread.daemon = True
-            self.read_thread.start()
+            self.read_thread = self.socket.start_background_task(
+                self._read_windows_output)
 
         except Exception as e:
             print(f"Failed to start Windows terminal: {e}")
@@ -81,8 +81,10 @@ class TerminalManager:
         """Thread that reads from the terminal and emits output"""
         while self.running and self.pty:
             try:
-                # Read available data
-                data = self.pty.read()
+                # winpty's read is a native call monkey patching can't make
+                # cooperative, so it runs on a native thread instead of
+                # stalling the event loop
+                data = tpool.execute(self.pty.read)
                 if data:
                     # Clean and emit immediately
                     self.socket.emit("terminal_output", data)
@@ -232,11 +234,10 @@ class TerminalManager:
                 time.sleep(0.1)
                 os.write(self.fd, "clear\n".encode())
 
-                # Start reading thread
+                # Start reading task on the socket server's event loop
                 self.running = True
-                self.thread = Thread(target=self._read_unix_output)
-                self.thread.daemon = True
-                self.thread.start()
+                self.thread = self.socket.start_background_task(
+                    self._read_unix_output)
             except Exception as e:
                 print(f"Failed to initialize terminal: {e}")
                 self.cleanup()
@@ -1,7 +1,9 @@
 """Workspace manager module for handling file operations and codebase management."""
 
 # pylama:ignore=E501,C901,E125,E251
+import difflib
 import hashlib
+import io
 import logging
 import math
 import mmap
@@ -180,6 +182,10 @@ class BM25Search:
         return best_snippet
 
 
+# A unified diff hunk header, capturing each range's start line
+HUNK_HEADER = re.compile(r"@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@")
+
+
 class WorkspaceManager:
     # File size thresholds and constants
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
@@ -188,12 +194,16 @@ class WorkspaceManager:
     LAZY_LOAD_THRESHOLD = 1000  # Number of files before switching to lazy loading
     MAX_CACHE_SIZE = 100 * 1024 * 1024  # 100MB max cache size
     MAX_CACHE_ENTRIES = 1000  # Maximum number of cached files
+    MAX_STRUCTURE_CACHE_ENTRIES = 128  # Maximum number of cached workspace trees
     INDEXING_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB chunks for indexing
     LARGE_FILE_THRESHOLD = 1 * 1024 * 1024  # 1MB threshold for large files
 
     # File type configurations
-    BINARY_EXTENSIONS = {".pyc", ".pyo", ".pyd", ".so", ".dll", ".exe", ".bin"}
-    SKIP_EXTENSIONS = {".db", ".log", ".cache"} | BINARY_EXTENSIONS
+    BINARY_EXTENSIONS = frozenset(
+        {".pyc", ".pyo", ".pyd", ".so", ".dll", ".exe", ".bin"})
+    SKIP_EXTENSIONS = frozenset({".db", ".log", ".cache"}) | BINARY_EXTENSIONS
+    # Tuple form for str.endswith, built once instead of per file
+    SKIP_SUFFIXES = tuple(sorted(SKIP_EXTENSIONS))
     SKIP_FOLDERS = {
         ".git",
         "node_modules",
@@ -277,7 +287,7 @@ class WorkspaceManager:
 
         # Enhanced caching system with LRU and size tracking
         self._content_cache: Dict[str, Tuple[str, float, int]] = {}
-        self._structure_cache: Dict[str, Tuple[List[dict], float]] = {}
+        self._structure_cache: Dict[str, Tuple[List[dict], int]] = {}
         self._chunk_cache: Dict[str, Dict[int, str]] = {}
         self._symbol_cache: Dict[str, Dict[str, List[Tuple[int, str]]]] = {}
         self._dependency_graph: Dict[str, Set[str]] = defaultdict(set)
@@ -286,6 +296,7 @@ class WorkspaceManager:
         self._cache_lock = threading.Lock()
         self._executor = ThreadPoolExecutor(max_workers=4)
         self._gitignore_patterns: List[str] = []
+        self._gitignore_regex: Optional[re.Pattern] = None
 
         self.logger.debug("Initialized caching systems and thread pool")
         self._load_gitignore()
@@ -361,13 +372,32 @@ class WorkspaceManager:
 
         return dependencies
 
+    @staticmethod
+    def _read_text(file_path: str) -> str:
+        """Read a file as UTF-8, falling back to latin-1, with a single read"""
+        with open(file_path, "rb") as f:
+            data = f.read()
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            # latin-1 can decode any bytes
+            text = data.decode("latin-1")
+        # Translate line endings the way text-mode reads do
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
     def _get_file_content(self,
                           file_path: str,
                           start_chunk: int = 0,
-                          num_chunks: int = 1) -> str:
+                          num_chunks: int = 1,
+                          stats: Optional[os.stat_result] = None) -> str:
         """Enhanced file content retrieval with chunked reading and caching"""
         try:
-            file_size = os.path.getsize(file_path)
+            # Callers that already stat'ed the file pass the result along
+            if stats is None:
+                stats = os.stat(file_path)
+            file_size = stats.st_size
             self.logger.debug(
                 f"Reading file {file_path} (size: {file_size} bytes)")
 
@@ -375,61 +405,30 @@ class WorkspaceManager:
             if file_size < self.LARGE_FILE_THRESHOLD:
                 if file_path in self._content_cache:
                     content, mtime, size = self._content_cache[file_path]
-                    if os.path.getmtime(
-                            file_path) == mtime and size == file_size:
+                    if stats.st_mtime == mtime and size == file_size:
                         self.logger.debug(f"Cache hit for {file_path}")
                         return content
 
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                        self._update_cache_size(file_path, content)
-                        self._content_cache[file_path] = (
-                            content,
-                            os.path.getmtime(file_path),
-                            file_size,
-                        )
-
-                        # Add to search index if it's a new file
-                        if file_path not in self.search_index.documents:
-                            try:
-                                rel_path = os.path.relpath(
-                                    file_path, self.workspace_root)
-                                self.search_index.add_document(
-                                    rel_path, content)
-                                self.logger.debug(
-                                    f"Added {rel_path} to search index")
-                            except Exception as e:
-                                self.logger.warning(
-                                    f"Failed to add {file_path} to search index: {e}"
-                                )
-
-                        return content
-                except UnicodeDecodeError:
-                    with open(file_path, "r", encoding="latin-1") as f:
-                        content = f.read()
-                        self._update_cache_size(file_path, content)
-                        self._content_cache[file_path] = (
-                            content,
-                            os.path.getmtime(file_path),
-                            file_size,
-                        )
+                content = self._read_text(file_path)
+                self._update_cache_size(file_path, content)
+                self._content_cache[file_path] = (
+                    content,
+                    stats.st_mtime,
+                    file_size,
+                )
 
-                        # Add to search index if it's a new file
-                        if file_path not in self.search_index.documents:
-                            try:
-                                rel_path = os.path.relpath(
-                                    file_path, self.workspace_root)
-                                self.search_index.add_document(
-                                    rel_path, content)
-                                self.logger.debug(
-                                    f"Added {rel_path} to search index")
-                            except Exception as e:
-                                self.logger.warning(
-                                    f"Failed to add {file_path} to search index: {e}"
-                                )
+                # Add to search index if it's a new file
+                if file_path not in self.search_index.documents:
+                    try:
+                        rel_path = os.path.relpath(file_path,
+                                                   self.workspace_root)
+                        self.search_index.add_document(rel_path, content)
+                        self.logger.debug(f"Added {rel_path} to search index")
+                    except Exception as e:
+                        self.logger.warning(
+                            f"Failed to add {file_path} to search index: {e}")
 
-                        return content
+                return content
 
             # For large files, use chunk cache and mmap for efficiency
             if file_path not in self._chunk_cache:
@@ -563,6 +562,41 @@ class WorkspaceManager:
                               exc_info=True)
             return {}
 
+    def _iter_files(self,
+                    workspace_dir: str,
+                    on_skip_dirs=None,
+                    on_error=None):
+        """Yield (DirEntry, rel_path) for files below workspace_dir.
+
+        Hidden and SKIP_FOLDERS directories are pruned by name before they
+        are opened; on_skip_dirs(dir_path, names) is told about them.
+        Directories that can't be scanned are passed to on_error(message),
+        which defaults to logging a warning.
+        """
+        if on_error is None:
+            on_error = self.logger.warning
+        stack = [(workspace_dir, "")]
+        while stack:
+            dir_path, rel_dir = stack.pop()
+            skipped = []
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        name = entry.name
+                        rel_path = (f"{rel_dir}{os.sep}{name}"
+                                    if rel_dir else name)
+                        if not entry.is_dir():
+                            yield entry, rel_path
+                        elif name.startswith(".") or name in self.SKIP_FOLDERS:
+                            skipped.append(name)
+                        elif not entry.is_symlink():
+                            # Like os.walk, don't follow directory links
+                            stack.append((entry.path, rel_path))
+            except OSError as e:
+                on_error(f"Error scanning directory {dir_path}: {e}")
+            if skipped and on_skip_dirs is not None:
+                on_skip_dirs(dir_path, skipped)
+
     def _parallel_scan(self, workspace_dir: str) -> List[Tuple[str, str]]:
         """Helper method for parallel directory scanning"""
 
@@ -573,7 +607,7 @@ class WorkspaceManager:
                     for entry in it:
                         if (entry.is_file() and not entry.name.startswith(".")
                                 and not entry.name.endswith(
-                                    tuple(self.SKIP_EXTENSIONS))):
+                                    self.SKIP_SUFFIXES)):
                             rel_path = os.path.relpath(entry.path,
                                                        workspace_dir)
                             if not self._should_ignore(rel_path):
@@ -596,7 +630,7 @@ class WorkspaceManager:
                         subdirs.append(entry.path)
                     elif (entry.is_file() and not entry.name.startswith(".")
                           and not entry.name.endswith(
-                              tuple(self.SKIP_EXTENSIONS))):
+                              self.SKIP_SUFFIXES)):
                         rel_path = os.path.relpath(entry.path, workspace_dir)
                         if not self._should_ignore(rel_path):
                             files.append((entry.path, rel_path))
@@ -714,20 +748,31 @@ class WorkspaceManager:
                                 pattern = f".*{pattern}"
                             if not line.endswith("/"):
                                 pattern = f"{pattern}($|/.*)"
+                            try:
+                                re.compile(pattern)
+                            except re.error:
+                                print(
+                                    f"Warning: Skipping invalid .gitignore pattern: {line}"
+                                )
+                                continue
                             patterns.append(pattern)
                     self._gitignore_patterns = patterns
+                    # Match all patterns in a single pass instead of one
+                    # re.match call per pattern
+                    if patterns:
+                        self._gitignore_regex = re.compile("|".join(
+                            f"(?:{pattern})" for pattern in patterns))
             except Exception as e:
                 print(f"Warning: Could not read .gitignore file: {e}")
 
     def _should_ignore(self, path: str) -> bool:
         """Check if a path should be ignored based on gitignore patterns"""
-        if not self._gitignore_patterns:
+        if self._gitignore_regex is None:
             return False
 
-        normalized_path = path.replace("\\", "/")
-        return any(
-            re.match(pattern, normalized_path)
-            for pattern in self._gitignore_patterns)
+        if os.sep != "/":
+            path = path.replace("\\", "/")
+        return self._gitignore_regex.match(path) is not None
 
     def _is_cache_valid(
             self, path: str, cache_entry: Tuple[Union[str, List[dict]],
@@ -765,9 +810,8 @@ class WorkspaceManager:
                 if self._should_ignore(rel_path):
                     continue
 
-                if entry.is_file() and not any(
-                        rel_path.endswith(ext)
-                        for ext in self.SKIP_EXTENSIONS):
+                if entry.is_file() and not rel_path.endswith(
+                        self.SKIP_SUFFIXES):
                     result.append({
                         "type": "file",
                         "path": rel_path.replace("\\", "/"),
@@ -795,63 +839,70 @@ class WorkspaceManager:
         except OSError:
             return []
 
-    def get_workspace_structure(self, workspace_dir: str) -> List[dict]:
-        """Get workspace structure with lazy loading for large directories"""
+    def get_workspace_structure(self, workspace_dir: str,
+                                run=None) -> List[dict]:
+        """Get workspace structure with lazy loading for large directories
+
+        run(func, workspace_dir), e.g. eventlet's tpool.execute, performs
+        the filesystem walk when given. The cache is only ever read and
+        written on the calling thread.
+        """
         try:
-            # Check if we have a valid cached structure
-            if workspace_dir in self._structure_cache:
-                structure, mtime = self._structure_cache[workspace_dir]
-                if os.path.getmtime(workspace_dir) == mtime:
-                    return structure
-
-            # Count total files to determine if we should use lazy loading
-            total_files = 0
-            print(f"\nCounting files in {workspace_dir}:")
-            for root, dirs, files in os.walk(workspace_dir):
-                # Skip .git and other ignored directories
-                original_dirs = set(dirs)
-                dirs[:] = [
-                    d for d in dirs
-                    if not d.startswith(".") and d not in self.SKIP_FOLDERS
-                ]
-                if len(original_dirs) != len(dirs):
-                    print(
-                        f"Skipped directories in {root}: {original_dirs - set(dirs)}"
-                    )
-
-                # Filter files based on gitignore and skip patterns
-                for file in files:
-                    if not file.startswith(".") and not file.endswith(
-                            tuple(self.SKIP_EXTENSIONS)):
-                        rel_path = os.path.relpath(os.path.join(root, file),
-                                                   workspace_dir)
-                        if not self._should_ignore(rel_path):
-                            total_files += 1
-                            print(f"Counting file: {rel_path}")
-                        else:
-                            print(f"Ignoring file (gitignore): {rel_path}")
-                    else:
-                        print(f"Ignoring file (hidden/extension): {file}")
+            # One stat serves the cache check and the new cache entry. It is
+            # taken before the walk, so a change made during it isn't missed
+            mtime = os.stat(workspace_dir).st_mtime_ns
+            cached = self._structure_cache.get(workspace_dir)
+            if cached is not None and cached[1] == mtime:
+                return cached[0]
+
+            walk = self._walk_workspace_structure
+            structure = (run(walk, workspace_dir)
+                         if run is not None else walk(workspace_dir))
+
+            # Re-inserted at the end, so the oldest workspace goes first
+            self._structure_cache.pop(workspace_dir, None)
+            if len(self._structure_cache) >= self.MAX_STRUCTURE_CACHE_ENTRIES:
+                self._structure_cache.pop(next(iter(self._structure_cache)),
+                                          None)
+            self._structure_cache[workspace_dir] = (structure, mtime)
+            return structure
+
+        except OSError:
+            return []
 
-            print(f"\nTotal files counted: {total_files}")
+    def _walk_workspace_structure(self, workspace_dir: str) -> List[dict]:
+        """Build a workspace's structure from disk.
 
-            if total_files > self.LAZY_LOAD_THRESHOLD:
-                # Use lazy loading - only get top-level structure
-                structure = self.get_directory_structure(workspace_dir,
-                                                         depth=1)
+        Only prints, so it is safe to run on a native thread.
+        """
+        # Count total files to determine if we should use lazy loading
+        total_files = 0
+        print(f"\nCounting files in {workspace_dir}:")
+        for entry, rel_path in self._iter_files(
+                workspace_dir,
+                on_skip_dirs=lambda root, names: print(
+                    f"Skipped directories in {root}: {set(names)}"),
+                on_error=print):
+            # Filter files based on gitignore and skip patterns
+            file = entry.name
+            if not file.startswith(".") and not file.endswith(
+                    self.SKIP_SUFFIXES):
+                if not self._should_ignore(rel_path):
+                    total_files += 1
+                    print(f"Counting file: {rel_path}")
+                else:
+                    print(f"Ignoring file (gitignore): {rel_path}")
             else:
-                # Get full structure for smaller workspaces
-                structure = self.get_directory_structure(workspace_dir,
-                                                         depth=float("inf"))
+                print(f"Ignoring file (hidden/extension): {file}")
 
-            self._structure_cache[workspace_dir] = (
-                structure,
-                os.path.getmtime(workspace_dir),
-            )
-            return structure
+        print(f"\nTotal files counted: {total_files}")
 
-        except OSError:
-            return []
+        if total_files > self.LAZY_LOAD_THRESHOLD:
+            # Use lazy loading - only get top-level structure
+            return self.get_directory_structure(workspace_dir, depth=1)
+        # Get full structure for smaller workspaces
+        return self.get_directory_structure(workspace_dir,
+                                            depth=float("inf"))
 
     def expand_directory(self,
                          dir_path: str,
@@ -919,9 +970,8 @@ class WorkspaceManager:
                                       )  # Debug log
                                 continue
 
-                            if entry.is_file() and not any(
-                                    entry_rel_path.endswith(ext)
-                                    for ext in self.SKIP_EXTENSIONS):
+                            if entry.is_file() and not entry_rel_path.endswith(
+                                    self.SKIP_SUFFIXES):
                                 # Debug log
                                 print(f"Adding file: {entry_rel_path}")
                                 entries.append({
@@ -1003,6 +1053,11 @@ class WorkspaceManager:
             self._structure_cache.clear()
             self._chunk_cache.clear()
 
+    def clear_structure_cache(self, workspace_dir: str):
+        """Forget a workspace's cached tree, e.g. after a nested change that
+        leaves the root directory's mtime alone"""
+        self._structure_cache.pop(workspace_dir, None)
+
     def get_workspace_context(self, workspace_dir: str) -> str:
         """Get a description of the workspace context"""
         self.logger.info(f"Getting workspace context for: {workspace_dir}")
@@ -1021,39 +1076,36 @@ class WorkspaceManager:
             total_size = 0
 
             # Only process files under size threshold
-            for root, _, files in os.walk(workspace_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        if os.path.getsize(
-                                file_path) < self.LARGE_FILE_THRESHOLD:
-                            rel_path = os.path.relpath(file_path,
-                                                       workspace_dir)
-                            if not self._should_ignore(rel_path):
-                                content = self._get_file_content(file_path)
-                                if content:
-                                    files_content[rel_path] = content
-                                    total_size += len(content.encode("utf-8"))
-                                    self.logger.debug(
-                                        f"Added {rel_path} to context (size: {len(content)} chars)"
-                                    )
-                    except OSError as e:
-                        self.logger.warning(
-                            f"Error processing file {file_path}: {e}")
+            for entry, rel_path in self._iter_files(workspace_dir):
+                try:
+                    if (entry.stat().st_size < self.LARGE_FILE_THRESHOLD
+                            and not self._should_ignore(rel_path)):
+                        content = self._get_file_content(entry.path)
+                        if content:
+                            files_content[rel_path] = content
+                            total_size += len(content.encode("utf-8"))
+                            self.logger.debug(
+                                f"Added {rel_path} to context (size: {len(content)} chars)"
+                            )
+                except OSError as e:
+                    self.logger.warning(
+                        f"Error processing file {entry.path}: {e}")
 
             # Build context string with structure
-            context = "Workspace Structure:\n"
+            parts = ["Workspace Structure:\n"]
             for item in structure:
                 prefix = "📁 " if item["type"] == "directory" else " "
-                context += f"{prefix}{item['path']}\n"
+                parts.append(f"{prefix}{item['path']}\n")
 
             # Add dependencies if files were processed
             if files_content:
-                context += "\nFile Relationships and Dependencies:\n"
+                parts.append("\nFile Relationships and Dependencies:\n")
                 dependencies = self._analyze_dependencies(files_content)
                 for file, deps in dependencies.items():
                     if deps:
-                        context += f"{file} depends on: {', '.join(deps)}\n"
+                        parts.append(
+                            f"{file} depends on: {', '.join(deps)}\n")
+            context = "".join(parts)
 
             elapsed_time = time.time() - start_time
             self.logger.info(
@@ -1069,6 +1121,96 @@ class WorkspaceManager:
                               exc_info=True)
             return f"Error generating context: {str(e)}"
 
+    @staticmethod
+    def _rebuild_with_replacements(
+            content: str, pairs: List[Tuple[str, str]]) -> Optional[str]:
+        """Apply every replacement in one pass, or None if they could interact"""
+        # Locate each old text in the original content once
+        matches = []
+        for index, (old, _) in enumerate(pairs):
+            pos = content.find(old)
+            while pos != -1:
+                matches.append((pos, pos + len(old), index))
+                pos = content.find(old, pos + len(old))
+        matches.sort()
+
+        # Anything closer than this to an edit could form a new match with it
+        reach = max(len(old) for old, _ in pairs) - 1
+        parts = []
+        cursor = 0
+        for start, end, index in matches:
+            if start < cursor or (parts and start - cursor < reach):
+                return None
+            new = pairs[index][1]
+            # A later change must not match text this edit produces
+            window = (content[max(start - reach, 0):start] + new +
+                      content[end:end + reach])
+            if any(old in window for old, _ in pairs[index + 1:]):
+                return None
+            parts.append(content[cursor:start])
+            parts.append(new)
+            cursor = end
+        parts.append(content[cursor:])
+        return "".join(parts)
+
+    def apply_replacements(self, content: str,
+                           pairs: List[Tuple[str, str]]) -> str:
+        """Apply (old, new) pairs with the result of chained str.replace calls"""
+        # Several changes are applied in one pass over the content when
+        # they can't affect each other, instead of copying it once per
+        # change
+        if len(pairs) > 1 and all(old for old, _ in pairs):
+            new_content = self._rebuild_with_replacements(content, pairs)
+            if new_content is not None:
+                return new_content
+        for old, new in pairs:
+            content = content.replace(old, new)
+        return content
+
+    @staticmethod
+    def unified_diff(a: List[str],
+                     b: List[str],
+                     fromfile: str = "",
+                     tofile: str = "",
+                     n: int = 3,
+                     lineterm: str = "\n"):
+        """difflib.unified_diff, matching only the lines that differ.
+
+        Lines shared at the start and end of both files are left out of
+        the comparison, apart from the n lines of context around the
+        change, and the hunk headers are shifted back to file positions.
+        """
+        limit = min(len(a), len(b))
+        prefix = 0
+        while prefix < limit and a[prefix] == b[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < limit - prefix
+               and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]):
+            suffix += 1
+
+        start = max(prefix - n, 0)
+        tail = max(suffix - n, 0)
+        lines = difflib.unified_diff(a[start:len(a) - tail],
+                                     b[start:len(b) - tail],
+                                     fromfile,
+                                     tofile,
+                                     n=n,
+                                     lineterm=lineterm)
+        if not start:
+            yield from lines
+            return
+
+        def shift(match):
+            return "@@ -{}{} +{}{} @@".format(
+                int(match.group(1)) + start, match.group(2) or "",
+                int(match.group(3)) + start, match.group(4) or "")
+
+        for line in lines:
+            if line.startswith("@@"):
+                line = HUNK_HEADER.sub(shift, line, count=1)
+            yield line
+
     def process_operations(self, operations: List[dict],
                            workspace_dir: str) -> List[dict]:
         """Process and validate operations, adding diffs for changes
@@ -1131,62 +1273,54 @@ class WorkspaceManager:
                     current_content = ""
                     if os.path.exists(file_path):
                         try:
-                            with open(file_path, "r", encoding="utf-8") as f:
-                                current_content = f.read()
-                        except UnicodeDecodeError:
-                            try:
-                                with open(file_path, "r",
-                                          encoding="latin-1") as f:
-                                    current_content = f.read()
-                            except Exception:
-                                pass
-
-                    # Generate unified diff
-                    from difflib import unified_diff
+                            current_content = self._read_text(file_path)
+                        except OSError:
+                            pass
 
                     changes = operation.get("changes", [])
-                    new_content = current_content
-                    for change in changes:
-                        if "old" in change and "new" in change:
-                            # Ensure we're not adding extra newlines during
-                            # replacement
-                            old_text = change["old"].rstrip("\n")
-                            new_text = change["new"].rstrip("\n")
-                            new_content = new_content.replace(
-                                old_text, new_text)
+                    # Ensure we're not adding extra newlines during
+                    # replacement
+                    new_content = self.apply_replacements(
+                        current_content,
+                        [(change["old"].rstrip("\n"),
+                          change["new"].rstrip("\n")) for change in changes
+                         if "old" in change and "new" in change])
 
                     # Ensure both contents end with exactly one newline
                     current_content = current_content.rstrip("\n") + "\n"
                     new_content = new_content.rstrip("\n") + "\n"
 
-                    # Generate diff with proper header formatting
-                    diff = [
-                        f'--- a/{operation["path"]}\n',
-                        f'+++ b/{operation["path"]}\n',
-                    ]
-
-                    # Get the diff content
-                    diff_content = unified_diff(
-                        current_content.splitlines(keepends=True),
-                        new_content.splitlines(keepends=True),
-                        fromfile="",  # Empty since we handle headers separately
-                        tofile="",
-                        lineterm=
-                        "\n",  # Add newline to each line including hunk header
-                    )
-                    # Skip the first two lines (headers) from unified_diff
-                    next(diff_content)  # Skip first header
-                    next(diff_content)  # Skip second header
-
-                    # Add the rest of the diff content, filtering out empty
-                    # added/removed lines
-                    filtered_content = [
-                        line for line in diff_content
-                        if not (line.startswith("+") or line.startswith("-"))
-                        or line.strip() not in ("+", "-")
-                    ]
-                    diff.extend(filtered_content)
-                    operation["diff"] = "".join(diff)
+                    if new_content == current_content:
+                        # Nothing matched, so there is nothing to diff
+                        operation["diff"] = ""
+                        operation["no_changes"] = True
+                    else:
+                        # Generate diff with proper header formatting
+                        diff = io.StringIO()
+                        diff.write(f'--- a/{operation["path"]}\n'
+                                   f'+++ b/{operation["path"]}\n')
+
+                        # Get the diff content
+                        diff_content = self.unified_diff(
+                            current_content.splitlines(keepends=True),
+                            new_content.splitlines(keepends=True),
+                            fromfile="",  # Empty since we handle headers separately
+                            tofile="",
+                            lineterm=
+                            "\n",  # Add newline to each line including hunk header
+                        )
+                        # Skip the first two lines (headers) from unified_diff
+                        next(diff_content)  # Skip first header
+                        next(diff_content)  # Skip second header
+
+                        # Add the rest of the diff content, filtering out
+                        # empty added/removed lines as the diff is generated
+                        diff.writelines(
+                            line for line in diff_content
+                            if not (line.startswith("+")
+                                    or line.startswith("-"))
+                            or line.strip() not in ("+", "-"))
+                        operation["diff"] = diff.getvalue()
 
                     # Run linter on Python files
                     if operation["path"].endswith(".py"):
@@ -1228,15 +1362,15 @@ class WorkspaceManager:
 
                 elif operation["type"] == "create_file":
                     # For new files, show the entire content as added
-                    diff = [
-                        "--- /dev/null\n",
-                        f'+++ b/{operation["path"]}\n',
-                        "@@ -0,0 +1,{} @@\n".format(
-                            operation["content"].count("\n") + 1),
-                    ]
-                    diff.extend(f"+{line}\n"
-                                for line in operation["content"].splitlines())
-                    operation["diff"] = "".join(diff)
+                    diff = io.StringIO()
+                    diff.write("--- /dev/null\n"
+                               f'+++ b/{operation["path"]}\n'
+                               "@@ -0,0 +1,{} @@\n".format(
+                                   operation["content"].count("\n") + 1))
+                    diff.writelines(
+                        f"+{line}\n"
+                        for line in operation["content"].splitlines())
+                    operation["diff"] = diff.getvalue()
 
                     # Run linter on new Python files
                     if operation["path"].endswith(".py"):
@@ -1280,22 +1414,16 @@ class WorkspaceManager:
                     # For file removal, show the entire content as removed
                     file_path = os.path.join(workspace_dir, operation["path"])
                     if os.path.exists(file_path):
-                        try:
-                            with open(file_path, "r", encoding="utf-8") as f:
-                                content = f.read()
-                        except UnicodeDecodeError:
-                            with open(file_path, "r", encoding="latin-1") as f:
-                                content = f.read()
-
-                        diff = [
-                            f'--- a/{operation["path"]}\n',
-                            "+++ /dev/null\n",
-                            "@@ -1,{} +0,0 @@\n".format(
-                                content.count("\n") + 1),
-                        ]
-                        diff.extend(f"-{line}\n"
-                                    for line in content.splitlines())
-                        operation["diff"] = "".join(diff)
+                        content = self._read_text(file_path)
+
+                        diff = io.StringIO()
+                        diff.write(f'--- a/{operation["path"]}\n'
+                                   "+++ /dev/null\n"
+                                   "@@ -1,{} +0,0 @@\n".format(
+                                       content.count("\n") + 1))
+                        diff.writelines(f"-{line}\n"
+                                        for line in content.splitlines())
+                        operation["diff"] = diff.getvalue()
                     else:
                         operation["diff"] = ""
 
@@ -1393,6 +1521,10 @@ class WorkspaceManager:
     def is_large_file(self, file_path: str) -> bool:
         """Check if a file is considered large based on LARGE_FILE_THRESHOLD"""
         try:
-            return os.path.getsize(file_path) > self.LARGE_FILE_THRESHOLD
+            return self.is_large_file_by_size(os.path.getsize(file_path))
         except OSError:
             return False
+
+    def is_large_file_by_size(self, size: int) -> bool:
+        """Check a size already known from a stat against LARGE_FILE_THRESHOLD"""
+        return size > self.LARGE_FILE_THRESHOLD